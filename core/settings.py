@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 import os
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 from dotenv import load_dotenv
 
 # load environment variables
@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "utils.dbrouter.ReplicaStickinessMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -84,7 +85,8 @@ WSGI_APPLICATION = "core.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.mysql",
+        # The MySQL backend on a bounded connection pool (see utils.mysql_pool)
+        "ENGINE": "utils.mysql_pool",
         "NAME": os.getenv("DB_NAME"),
         "USER": os.getenv("DB_USER"),
         "PASSWORD": os.getenv("DB_PASSWORD"),
@@ -94,14 +96,37 @@ DATABASES = {
             "charset": "utf8mb4",
             "init_command": "SET sql_mode='STRICT_TRANS_TABLES'",
         },
-        "CONN_MAX_AGE": 60,
+        # Hand connections back to the pool at the end of every request
+        "CONN_MAX_AGE": 0,
         "POOL_OPTIONS": {
-            "POOL_SIZE": 20,
-            "MAX_OVERFLOW": 10,
+            "POOL_SIZE": 20,  # Idle connections kept per process
+            "MAX_OVERFLOW": 10,  # Extra connections opened under load
+            "TIMEOUT": 30,  # Seconds a checkout waits for a free connection
+            "MAX_LIFETIME": 1800,  # Seconds before a connection is replaced
+            "HEALTH_CHECK_IDLE": 5,  # Ping connections idle this long on checkout
         },
     }
 }
 
+# Read replicas (see utils.dbrouter): DB_REPLICA_HOSTS is a comma-separated
+# list of host[:port], each a copy of default that scans and reads go to
+DATABASE_REPLICAS: List[str] = []
+for index, replica in enumerate(
+    filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(","))
+):
+    host, _, port = replica.partition(":")
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(f"replica_{index}")
+
+DATABASE_ROUTERS = ["utils.dbrouter.PrimaryReplicaRouter"]
+# Reads stay on the primary this long after a write, to read your own writes
+REPLICA_STICKY_SECONDS: float = 5.0
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -145,6 +170,13 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 
+# Primary keys of BaseModel (see utils.basemodel)
+# Time-ordered UUIDv7 defaults instead of random UUIDv4
+UUID7_KEYS: bool = os.getenv("UUID7_KEYS", "false").lower() == "true"
+# binary(16) key columns on MySQL; run convert_uuid_keys before flipping it
+BINARY_UUID_KEYS: bool = os.getenv("BINARY_UUID_KEYS", "false").lower() == "true"
+
+
 # Redis Cache Configuration
 CACHES: Dict[str, Dict[str, Any]] = {
     "default": {
@@ -170,6 +202,15 @@ CACHES: Dict[str, Dict[str, Any]] = {
         },
     }
 }
+# Small, hot keys such as regenerate_tokens progress: same Redis, uncompressed
+CACHES["progress"] = {
+    **CACHES["default"],
+    "OPTIONS": {
+        key: value
+        for key, value in CACHES["default"]["OPTIONS"].items()
+        if key != "COMPRESSOR"
+    },
+}
 
 # Use Redis as Session backend
 SESSION_ENGINE: str = "django.contrib.sessions.backends.cache"
@@ -178,6 +219,12 @@ SESSION_CACHE_ALIAS: str = "default"
 # Cache timeout settings
 CACHE_TTL: int = 60 * 15  # 15 minutes
 CACHE_LONG_TTL: int = 60 * 60 * 24  # 24 hours
+TOKEN_NEGATIVE_CACHE_TTL: int = 30  # Unknown ticket tokens, 30 seconds
+TOKEN_VALIDATE_MAX_BATCH: int = 1000  # Tokens per batch validation request
+
+# Bloom filter of live ticket tokens (see build_token_filter)
+TOKEN_FILTER_PATH: Optional[str] = os.getenv("TOKEN_FILTER_PATH")  # Local snapshot
+TOKEN_FILTER_REFRESH_SECONDS: float = 1.0  # How often processes catch up
 
 # Redis lock timeout settings
 REDIS_LOCK_TIMEOUT: int = 60  # 60 seconds
@@ -1,6 +1,11 @@
+import random
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 from user.models import User
 from order.models import Order
+from utils.basemodel import bulk_insert, new_uuid
+from utils.dbrouter import use_primary
+from utils.workload import PROFILES
 from faker import Faker
 
 
@@ -10,36 +15,67 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--count", type=int, default=10000)
         parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--seed", type=int, help="Seed random and Faker for a reproducible dataset"
+        )
+        parser.add_argument(
+            "--profile",
+            choices=list(PROFILES),
+            default="uniform",
+            help="Workload profile shaping whales, timestamps and deletions",
+        )
 
     def handle(self, *args, **options):
         count = options["count"]
+        if options["seed"] is not None:
+            random.seed(options["seed"])
+            Faker.seed(options["seed"])
         batch_size = options["batch_size"]
+        profile = PROFILES[options["profile"]]
         fake = Faker()
 
-        # Get all user IDs or exit if no users exist
-        user_ids = list(User.objects.values_list("id", flat=True))
+        # Get all users or exit if none exist; orders of a soft-deleted user
+        # are soft-deleted with it, as soft_delete() cascades. Read from the
+        # primary, which replicas may still lag right after seed_users
+        with use_primary():
+            user_deleted_at = dict(User.all_objects.values_list("id", "deleted_at"))
+        user_ids = list(user_deleted_at)
         if not user_ids:
             self.stdout.write(
                 self.style.ERROR("No users found. Please run seed_users first")
             )
             return
 
+        # Whales are picked proportionally more often
+        user_cum_weights = profile.user_cum_weights(random, len(user_ids))
+
         self.stdout.write(f"Creating {count} orders...")
 
         # Process in batches to handle large datasets
         total_created = 0
         for i in range(0, count, batch_size):
             batch_count = min(batch_size, count - i)
+            now = timezone.now()
             orders = [
                 Order(
-                    user_id=fake.random_element(user_ids),
+                    id=new_uuid(random),
+                    user_id=user_id,
                     name=fake.name(),
+                    created_at=created_at,
+                    updated_at=created_at,
+                    deleted_at=user_deleted_at[user_id] or (now if deleted else None),
+                )
+                for user_id, created_at, deleted in zip(
+                    random.choices(
+                        user_ids, cum_weights=user_cum_weights, k=batch_count
+                    ),
+                    profile.sample_created_at(random, now, batch_count),
+                    profile.sample_deleted(random, batch_count),
                 )
-                for _ in range(batch_count)
             ]
 
             # Bulk create current batch
-            Order.objects.bulk_create(orders)
+            bulk_insert(Order, orders)
             total_created += batch_count
 
             # Show progress
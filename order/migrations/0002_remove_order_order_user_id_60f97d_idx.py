@@ -0,0 +1,16 @@
+# Generated by Django 5.1.3 on 2026-10-17 07:21
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("order", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="order",
+            name="order_user_id_60f97d_idx",
+        ),
+    ]
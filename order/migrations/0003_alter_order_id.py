@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-17 07:24
+
+import utils.basemodel
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("order", "0002_remove_order_order_user_id_60f97d_idx"),
+    ]
+
+    # State only: ticket.0005 rewrites the key columns of all three tables
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="order",
+                    name="id",
+                    field=utils.basemodel.BinaryUUIDField(
+                        default=utils.basemodel.new_uuid,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+            ],
+        ),
+    ]
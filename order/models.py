@@ -13,7 +13,7 @@ class Order(BaseModel):
 
     class Meta:
         db_table = "order"
+        # user (FK) is already indexed by its field
         indexes = [
             models.Index(fields=["name"]),
-            models.Index(fields=["user_id"]),
         ]
@@ -0,0 +1,276 @@
+import hashlib
+import math
+import struct
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from ticket.models import Ticket
+from utils.dbrouter import use_primary
+
+SNAPSHOT_KEY = "ticket_token_bloom"
+VERSION_KEY = "ticket_token_bloom:version"
+SEQUENCE_KEY = "ticket_token_bloom:sequence"
+BUILDING_KEY = "ticket_token_bloom:building"
+
+
+def delta_key(sequence):
+    return f"ticket_token_bloom:delta:{sequence}"
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter of strings, serialisable to bytes
+
+    The k bit positions come from double hashing one 128-bit blake2b digest.
+    version identifies the published snapshot, and sequence is the last
+    delta from the log that has been folded in.
+    """
+
+    magic = b"TKBF"
+    # magic, version, sequence, bit count, hash count, item count
+    header = struct.Struct("<4s16sQQQQ")
+
+    def __init__(self, bit_count, hash_count, bits=None, count=0, version=None):
+        self.bit_count = bit_count
+        self.hash_count = hash_count
+        self.bits = bytearray((bit_count + 7) // 8) if bits is None else bits
+        self.count = count
+        self.version = version or uuid.uuid4().bytes
+        self.sequence = 0
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate):
+        """Size the filter so capacity items give about error_rate false positives"""
+        capacity = max(capacity, 1)
+        bit_count = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hash_count = max(1, round(bit_count / capacity * math.log(2)))
+        return cls(bit_count, hash_count)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        # An odd step visits hash_count distinct positions
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bit_count for i in range(self.hash_count)]
+
+    def add(self, item):
+        bits = self.bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+    def to_bytes(self):
+        return (
+            self.header.pack(
+                self.magic,
+                self.version,
+                self.sequence,
+                self.bit_count,
+                self.hash_count,
+                self.count,
+            )
+            + self.bits
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, sequence, bit_count, hash_count, count = cls.header.unpack_from(
+            data
+        )
+        if magic != cls.magic:
+            raise ValueError("Not a serialised BloomFilter")
+        bloom = cls(
+            bit_count,
+            hash_count,
+            bits=bytearray(data[cls.header.size :]),
+            count=count,
+            version=version,
+        )
+        bloom.sequence = sequence
+        return bloom
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def build_token_filter(error_rate=0.001, headroom=2.0, chunk_size=10000):
+    """Stream every live ticket token into a new filter
+
+    headroom sizes the filter beyond today's count, so the tokens a full
+    rotation adds keep the false-positive rate near error_rate.
+    """
+    # Tokens are only logged while a filter is published or being built
+    cache.set(BUILDING_KEY, True, settings.CACHE_LONG_TTL)
+    # Read the log position first: tokens published after it are replayed
+    # by every process on load, so none can slip between scan and snapshot
+    sequence = cache.get(SEQUENCE_KEY, 0)
+    # That only holds for rows committed before the read, which a lagging
+    # replica may not have yet
+    with use_primary():
+        bloom = BloomFilter.for_capacity(
+            int(Ticket.objects.count() * headroom), error_rate
+        )
+        bloom.update(
+            Ticket.objects.values_list("token", flat=True).iterator(
+                chunk_size=chunk_size
+            )
+        )
+    bloom.sequence = sequence
+    return bloom
+
+
+def publish_token_filter(bloom):
+    """Make bloom the snapshot every process loads and reloads"""
+    cache.set(SNAPSHOT_KEY, bloom.to_bytes(), None)
+    cache.set(VERSION_KEY, bloom.version, None)
+    cache.delete(BUILDING_KEY)
+
+
+def publish_tokens(tokens):
+    """Append new tokens to the log every process's filter catches up on
+
+    Without a filter published or being built nobody would read them, and
+    the first snapshot scans them from the table anyway.
+    """
+    tokens = list(tokens)
+    if not tokens or not cache.get_many([VERSION_KEY, BUILDING_KEY]):
+        return
+    cache.add(SEQUENCE_KEY, 0, None)
+    sequence = cache.incr(SEQUENCE_KEY)
+    cache.set(delta_key(sequence), tokens, settings.CACHE_LONG_TTL)
+
+
+class TokenFilter:
+    """This process's copy of the published filter, kept in sync with the log
+
+    A Bloom filter cannot forget, so soft-deleted and rotated-away tokens
+    stay "maybe" until the next rebuild; the lookups behind the filter
+    still answer those correctly. Whenever the copy may be missing tokens
+    (nothing published, or a delta not readable) every token is a "maybe",
+    so the filter never rejects a live ticket. A delta that is gone for
+    good has the snapshot rebuilt, as the log can no longer catch it up.
+    """
+
+    def __init__(self):
+        # (filter, synced), replaced in one assignment, so readers need no lock
+        self.state = (None, False)
+        # The delta found missing at the last refresh
+        self.missing = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+    def might_contain(self, token):
+        self._refresh()
+        bloom, synced = self.state
+        return not synced or token in bloom
+
+    def _refresh(self):
+        """Catch up with the log at most every TOKEN_FILTER_REFRESH_SECONDS"""
+        if not self._due():
+            return
+        with self.lock:
+            if self._due():
+                self.checked_at = time.monotonic()
+                self.state = self._sync()
+
+    def _due(self):
+        return (
+            self.checked_at is None
+            or time.monotonic() - self.checked_at
+            >= settings.TOKEN_FILTER_REFRESH_SECONDS
+        )
+
+    def _sync(self):
+        """The (filter, synced) state once caught up with the log
+
+        A new snapshot replaces the current one only after its deltas are
+        replayed. Deltas go into the current filter in place, as adding
+        only sets bits: no reader loses a token it could already see.
+        """
+        bloom = self.state[0]
+        state = cache.get_many([VERSION_KEY, SEQUENCE_KEY])
+        version = state.get(VERSION_KEY)
+        if version is None:
+            return None, False
+        if bloom is None or bloom.version != version:
+            self.missing = None
+            bloom = self._load(version)
+            if bloom is None:
+                return None, False
+
+        published = state.get(SEQUENCE_KEY, 0)
+        if published <= bloom.sequence:
+            return bloom, True
+        sequences = range(bloom.sequence + 1, published + 1)
+        deltas = cache.get_many([delta_key(sequence) for sequence in sequences])
+        for sequence in sequences:
+            tokens = deltas.get(delta_key(sequence))
+            if tokens is None:
+                self._missing(sequence)
+                return bloom, False
+            bloom.update(tokens)
+            bloom.sequence = sequence
+        self.missing = None
+        return bloom, True
+
+    def _missing(self, sequence):
+        """Retry a missing delta once, then rebuild the snapshot without it
+
+        A delta is written right after its sequence is drawn, so one still
+        missing a refresh later has expired or lost its writer.
+        """
+        if sequence != self.missing:
+            self.missing = sequence
+            return
+        self.missing = None
+        # One process rebuilds, off the request path; the others stay
+        # unsynced until the new snapshot is published
+        if cache.add(BUILDING_KEY, True, settings.CACHE_LONG_TTL):
+            threading.Thread(
+                target=self._rebuild, name="token-filter-rebuild", daemon=True
+            ).start()
+
+    def _rebuild(self):
+        try:
+            publish_token_filter(build_token_filter())
+        except Exception:
+            cache.delete(BUILDING_KEY)
+            raise
+        finally:
+            connections.close_all()
+
+    def _load(self, version):
+        """Load the published snapshot, from TOKEN_FILTER_PATH when that copy is current"""
+        if settings.TOKEN_FILTER_PATH:
+            try:
+                bloom = BloomFilter.load(settings.TOKEN_FILTER_PATH)
+            except FileNotFoundError:
+                bloom = None
+            if bloom is not None and bloom.version == version:
+                return bloom
+        data = cache.get(SNAPSHOT_KEY)
+        return BloomFilter.from_bytes(data) if data is not None else None
+
+
+token_filter = TokenFilter()
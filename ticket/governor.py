@@ -0,0 +1,121 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+# MySQL "Lock wait timeout exceeded" and "Deadlock found"
+LOCK_WAIT_ERRORS = {1205, 1213}
+
+
+def is_lock_wait(error):
+    """Whether a database error means the batch lost a lock and can be retried"""
+    return bool(error.args) and error.args[0] in LOCK_WAIT_ERRORS
+
+
+class BatchGovernor:
+    """Adapt one worker's batch size and inter-batch pause to commit latency
+
+    Additive increase while commits stay under the target latency,
+    proportional decrease above it, and a halved batch with a doubled pause
+    after a lock wait. A target of 0 keeps the batch size and pause fixed.
+    """
+
+    max_pause = 1.0
+
+    def __init__(
+        self, batch_size, min_batch_size, max_batch_size, target_latency, pause=0.01
+    ):
+        self.batch_size = batch_size
+        self.min_batch_size = min(min_batch_size, batch_size)
+        self.max_batch_size = max(max_batch_size, batch_size)
+        self.target_latency = target_latency
+        self.pause = pause
+
+    @property
+    def adaptive(self):
+        return self.target_latency > 0
+
+    def record_commit(self, seconds):
+        if not self.adaptive:
+            return
+        if seconds <= self.target_latency:
+            step = max(1, self.batch_size // 10)
+            self.batch_size = min(self.max_batch_size, self.batch_size + step)
+            self.pause /= 2
+        else:
+            scaled = int(self.batch_size * self.target_latency / seconds)
+            self.batch_size = max(self.min_batch_size, scaled)
+            self.pause = min(self.max_pause, max(self.pause * 2, 0.01))
+
+    def record_lock_wait(self):
+        if not self.adaptive:
+            return
+        self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+        self.pause = min(self.max_pause, max(self.pause * 2, 0.05))
+
+
+class RateLimiter:
+    """Token bucket of rows per second shared by every worker of a rotation
+
+    The bucket lives in the Redis behind the default cache, so threads,
+    pool processes and other hosts draw from one budget. Callers reserve
+    rows up front and sleep off any debt, which keeps the script a single
+    atomic round-trip.
+    """
+
+    script = """
+    local now = redis.call('TIME')
+    now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local requested = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + (now - ts) * rate) - requested
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], 3600)
+    if tokens >= 0 then
+        return '0'
+    end
+    return tostring(-tokens / rate)
+    """
+
+    def __init__(self, rows_per_second, key="token_rotation:rate_limit"):
+        self.key = cache.make_key(key)
+        self.rate = rows_per_second
+        self.lock = threading.Lock()
+        self.tokens = rows_per_second
+        self.updated = time.monotonic()
+        self.client = None
+        if rows_per_second > 0:
+            try:
+                self.client = get_redis_connection("default")
+                self.reserve = self.client.register_script(self.script)
+            except NotImplementedError:
+                # Not a django_redis cache: the budget is shared within this process only
+                pass
+
+    def acquire(self, rows):
+        """Block until rows may be written without exceeding the budget"""
+        if self.rate <= 0:
+            return
+        time.sleep(self._reserve(rows))
+
+    def _reserve(self, rows):
+        if self.client is not None:
+            try:
+                return float(
+                    self.reserve(keys=[self.key], args=[self.rate, self.rate, rows])
+                )
+            except RedisError:
+                # Redis is unreachable: fall back to this process's own bucket
+                pass
+        with self.lock:
+            now = time.monotonic()
+            elapsed = now - self.updated
+            self.tokens = min(self.rate, self.tokens + elapsed * self.rate) - rows
+            self.updated = now
+            return max(0.0, -self.tokens / self.rate)
@@ -0,0 +1,195 @@
+import os
+import socket
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+
+class LeaseLost(Exception):
+    """The range was reclaimed by another host; its work is left to that host"""
+
+
+class RedisLeaseStore:
+    """Leases as expiring keys in the Redis behind a django_redis cache
+
+    A claim also draws a fencing token from a per-job counter; the lease
+    value carries it, so only the claim that set a key can renew or
+    release it.
+    """
+
+    claim_script = """
+    if redis.call('EXISTS', KEYS[1]) == 1 then
+        return false
+    end
+    local token = redis.call('INCR', KEYS[2])
+    redis.call('EXPIRE', KEYS[2], 604800)
+    redis.call('SET', KEYS[1], ARGV[1] .. ':' .. token, 'PX', ARGV[2])
+    return token
+    """
+    renew_script = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+    release_script = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._claim = client.register_script(self.claim_script)
+        self._renew = client.register_script(self.renew_script)
+        self._release = client.register_script(self.release_script)
+
+    def claim(self, key, fence_key, owner, ttl):
+        """The claim's fencing token, or None if the key is leased"""
+        token = self._claim(keys=[key, fence_key], args=[owner, int(ttl * 1000)])
+        return None if token is None else int(token)
+
+    def renew(self, key, value, ttl):
+        return bool(self._renew(keys=[key], args=[value, int(ttl * 1000)]))
+
+    def release(self, key, value):
+        self._release(keys=[key], args=[value])
+
+
+class LocalLeaseStore:
+    """In-process stand-in for RedisLeaseStore, shared by the threads of one process
+
+    Lets tests and a cache without Redis run the distributed mode, with
+    "hosts" as threads; it cannot coordinate separate processes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key: (value, expires at)
+        self.leases = {}
+        self.fences = {}
+
+    def claim(self, key, fence_key, owner, ttl):
+        with self.lock:
+            lease = self.leases.get(key)
+            if lease is not None and lease[1] > time.monotonic():
+                return None
+            token = self.fences[fence_key] = self.fences.get(fence_key, 0) + 1
+            self.leases[key] = (f"{owner}:{token}", time.monotonic() + ttl)
+            return token
+
+    def renew(self, key, value, ttl):
+        with self.lock:
+            lease = self.leases.get(key)
+            if lease is None or lease[0] != value or lease[1] <= time.monotonic():
+                return False
+            self.leases[key] = (value, time.monotonic() + ttl)
+            return True
+
+    def release(self, key, value):
+        with self.lock:
+            if self.leases.get(key, (None,))[0] == value:
+                del self.leases[key]
+
+
+_local_store = LocalLeaseStore()
+
+
+def lease_store(alias="default"):
+    """The Redis lease store of the cache alias, or the in-process stand-in"""
+    try:
+        return RedisLeaseStore(get_redis_connection(alias))
+    except NotImplementedError:
+        return _local_store
+
+
+class RangeLeases:
+    """This host's leases on ranges of one rotation job
+
+    A host works on a range only while it holds its lease. A heartbeat
+    thread renews every held lease each third of ttl; a lease that could
+    not be renewed for ttl seconds counts as lost, as by then it may have
+    expired and been claimed by another host. The claim's fencing token
+    is also written to the range's checkpoint row, so a host that lost the
+    lease cannot commit anything more to the range.
+    """
+
+    def __init__(self, job_id, ttl=30.0, owner=None, store=None):
+        self.job_id = job_id
+        self.ttl = ttl
+        self.owner = owner or (
+            f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        )
+        self.store = store or lease_store()
+        self.fence_key = cache.make_key(f"token_rotation:{job_id}:fence")
+        self.lock = threading.Lock()
+        # range id: (lease value, fencing token, last renewed)
+        self.held = {}
+        self.stopped = threading.Event()
+        self.heartbeat = None
+
+    def claim(self, range_id):
+        """Lease the range; its fencing token, or None if another host holds it"""
+        token = self.store.claim(
+            self._key(range_id), self.fence_key, self.owner, self.ttl
+        )
+        if token is None:
+            return None
+        with self.lock:
+            self.held[range_id] = (f"{self.owner}:{token}", token, time.monotonic())
+            if self.heartbeat is None:
+                self.heartbeat = threading.Thread(
+                    target=self._run, name="heartbeat", daemon=True
+                )
+                self.heartbeat.start()
+        return token
+
+    def token(self, range_id):
+        """The fencing token of a held lease; LeaseLost if it is no longer held"""
+        with self.lock:
+            lease = self.held.get(range_id)
+        if lease is None or time.monotonic() - lease[2] >= self.ttl:
+            raise LeaseLost(f"Lease on range {range_id} lost")
+        return lease[1]
+
+    def release(self, range_id):
+        with self.lock:
+            lease = self.held.pop(range_id, None)
+        if lease is not None:
+            try:
+                self.store.release(self._key(range_id), lease[0])
+            except RedisError:
+                # It expires on its own
+                pass
+
+    def stop(self):
+        self.stopped.set()
+        if self.heartbeat is not None:
+            self.heartbeat.join()
+
+    def _key(self, range_id):
+        return cache.make_key(f"token_rotation:{self.job_id}:lease:{range_id}")
+
+    def _run(self):
+        while not self.stopped.wait(self.ttl / 3):
+            with self.lock:
+                held = list(self.held.items())
+            for range_id, (value, token, _) in held:
+                try:
+                    renewed = self.store.renew(self._key(range_id), value, self.ttl)
+                except RedisError:
+                    # Retried next beat; token() gives up once ttl has passed
+                    continue
+                with self.lock:
+                    # Released, or released and claimed again, meanwhile
+                    if self.held.get(range_id, (None, None))[1] != token:
+                        continue
+                    if renewed:
+                        self.held[range_id] = (value, token, time.monotonic())
+                    else:
+                        del self.held[range_id]
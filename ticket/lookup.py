@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from ticket.bloom import token_filter
+from ticket.models import Ticket
+
+# Distinguishes "not in the cache" from a cached "not found" (None)
+_MISS = object()
+
+TOKEN_MAX_LENGTH = Ticket._meta.get_field("token").max_length
+
+
+def token_cache_key(token):
+    return f"ticket_token:{token}"
+
+
+def serialize_ticket(ticket):
+    """The lookup payload: the ticket with the order and user it belongs to"""
+    order = ticket.order
+    user = order.user
+    return {
+        "ticket": {"id": str(ticket.id), "name": ticket.name, "token": ticket.token},
+        "order": {"id": str(order.id), "name": order.name},
+        "user": {"id": str(user.id), "email": user.email, "name": user.name},
+    }
+
+
+def live_tickets():
+    """Tickets whose ticket, order and user are all not soft-deleted"""
+    return Ticket.objects.select_related("order__user").filter(ancestors_alive=True)
+
+
+def is_candidate(token):
+    """Whether a token could belong to a live ticket at all"""
+    return (
+        bool(token)
+        and len(token) <= TOKEN_MAX_LENGTH
+        and token_filter.might_contain(token)
+    )
+
+
+def lookup_token(token):
+    """Resolve a token to its payload, or None, reading through the cache
+
+    Tokens the Bloom filter has never seen are rejected without a round
+    trip. Hits are cached for CACHE_TTL. Misses are cached for the much
+    shorter TOKEN_NEGATIVE_CACHE_TTL, so repeated junk tokens stop at Redis
+    without hiding a new ticket for long.
+    """
+    if not is_candidate(token):
+        return None
+
+    key = token_cache_key(token)
+    payload = cache.get(key, _MISS)
+    if payload is not _MISS:
+        return payload
+
+    try:
+        payload = serialize_ticket(live_tickets().get(token=token))
+    except Ticket.DoesNotExist:
+        cache.set(key, None, settings.TOKEN_NEGATIVE_CACHE_TTL)
+        return None
+    cache.set(key, payload, settings.CACHE_TTL)
+    return payload
+
+
+def lookup_tokens(tokens):
+    """Resolve many tokens at once: {token: payload or None}
+
+    One MGET answers the cached tokens; the rest share one token__in query,
+    whose hits and misses are then written back to the cache.
+    """
+    tokens = list(dict.fromkeys(tokens))
+    results = {token: None for token in tokens}
+    tokens = [token for token in tokens if is_candidate(token)]
+    if not tokens:
+        return results
+
+    cached = cache.get_many([token_cache_key(token) for token in tokens])
+    misses = []
+    for token in tokens:
+        key = token_cache_key(token)
+        if key in cached:
+            results[token] = cached[key]
+        else:
+            misses.append(token)
+    if not misses:
+        return results
+
+    found = {}
+    for ticket in live_tickets().filter(token__in=misses):
+        results[ticket.token] = found[ticket.token] = serialize_ticket(ticket)
+    if found:
+        cache.set_many(
+            {token_cache_key(token): payload for token, payload in found.items()},
+            settings.CACHE_TTL,
+        )
+    not_found = [token_cache_key(token) for token in misses if token not in found]
+    if not_found:
+        cache.set_many(dict.fromkeys(not_found), settings.TOKEN_NEGATIVE_CACHE_TTL)
+    return results
+
+
+def invalidate_tokens(tokens):
+    """Cache tokens that stopped being valid as not found
+
+    A plain delete would let the next miss re-read the old row from a
+    replica that has not caught up yet and cache it for CACHE_TTL; the
+    negative entry outlives that lag instead.
+    """
+    keys = [token_cache_key(token) for token in tokens]
+    if keys:
+        cache.set_many(dict.fromkeys(keys), settings.TOKEN_NEGATIVE_CACHE_TTL)
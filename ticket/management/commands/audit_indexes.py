@@ -0,0 +1,191 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+
+def column_list(value):
+    return [column for column in value.split(",") if column]
+
+
+class Command(BaseCommand):
+    help = "Report redundant or overlapping indexes with their size and write cost"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "app_labels",
+            nargs="*",
+            default=["user", "order", "ticket"],
+            help="Apps whose tables are audited",
+        )
+        parser.add_argument(
+            "--updated-columns",
+            type=column_list,
+            default=["token", "updated_at"],
+            help="Columns a token rotation updates; indexes on them are "
+            "rewritten for every rotated row",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="List every index, not only the redundant ones",
+        )
+
+    def handle(self, *args, **options):
+        updated_columns = set(options["updated_columns"])
+        models = [
+            model
+            for label in options["app_labels"]
+            for model in apps.get_app_config(label).get_models()
+        ]
+        tables = sorted({model._meta.db_table for model in models})
+        expected = self._get_model_index_names(models)
+
+        redundant_count = 0
+        redundant_bytes = 0
+        with connection.cursor() as cursor:
+            for table in tables:
+                indexes = self._get_indexes(cursor, table, expected)
+                sizes = self._get_index_sizes(cursor, table)
+                rotation_writes = sum(
+                    1 for index in indexes if updated_columns & set(index["columns"])
+                )
+                self.stdout.write(
+                    f"{table}: {len(indexes)} indexes written per insert or delete, "
+                    f"{rotation_writes} per rotated row"
+                )
+
+                for index in indexes:
+                    covering = self._covering_index(index, indexes)
+                    if covering is None and not options["all"]:
+                        continue
+                    size = sizes.get(index["name"])
+                    line = (
+                        f"  {index['name']} ({', '.join(index['columns'])}): "
+                        f"{self._format_size(size)}"
+                    )
+                    if updated_columns & set(index["columns"]):
+                        line += ", rewritten on rotation"
+                    if covering is None:
+                        self.stdout.write(line)
+                        continue
+                    redundant_count += 1
+                    redundant_bytes += size or 0
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"{line}, redundant with {covering['name']} "
+                            f"({', '.join(covering['columns'])})"
+                        )
+                    )
+
+        if redundant_count:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{redundant_count} redundant indexes, "
+                    f"{self._format_size(redundant_bytes)} in total"
+                )
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS("No redundant indexes"))
+
+    def _get_model_index_names(self, models):
+        """Names of the indexes the current models define, Meta and field ones"""
+        editor = connection.schema_editor()
+        names = set()
+        for model in models:
+            names.update(index.name for index in model._meta.indexes)
+            names.update(
+                # The name the schema editor gives a field's own index
+                editor._create_index_name(model._meta.db_table, [field.column])
+                for field in model._meta.local_fields
+                if editor._field_should_be_indexed(model, field)
+            )
+        return names
+
+    def _get_indexes(self, cursor, table, expected):
+        """Every index-backed constraint of the table, with its ordered columns"""
+        indexes = []
+        constraints = connection.introspection.get_constraints(cursor, table)
+        for name, info in constraints.items():
+            if not info["columns"] or not (
+                info["index"] or info["unique"] or info["primary_key"]
+            ):
+                continue
+            # Foreign keys are listed on their own, but are backed by an index
+            if info["foreign_key"] and not info["index"]:
+                continue
+            indexes.append(
+                {
+                    "name": name,
+                    "columns": list(info["columns"]),
+                    "unique": bool(info["unique"]),
+                    "primary_key": bool(info["primary_key"]),
+                    "expected": name in expected,
+                }
+            )
+        return indexes
+
+    def _covering_index(self, index, indexes):
+        """Another index that makes this one redundant, or None
+
+        An index is redundant when another one starts with the same columns:
+        the longer index answers the same lookups. Unique indexes only give
+        way to an identical unique index. Of two identical indexes the unique
+        one is kept, else the one the current models still define.
+        """
+        if index["primary_key"]:
+            return None
+        columns = index["columns"]
+        for other in indexes:
+            if other is index or other["columns"][: len(columns)] != columns:
+                continue
+            identical = len(other["columns"]) == len(columns)
+            if index["unique"] and not (other["unique"] and identical):
+                continue
+            if identical and not self._keeps(other, index):
+                continue
+            return other
+        return None
+
+    def _keeps(self, other, index):
+        """Of two identical indexes, whether other is the one worth keeping"""
+        if other["primary_key"] or other["unique"] != index["unique"]:
+            return other["primary_key"] or other["unique"]
+        if other["expected"] != index["expected"]:
+            return other["expected"]
+        return other["name"] < index["name"]
+
+    def _get_index_sizes(self, cursor, table):
+        """{index name: bytes} from the backend's statistics, where it keeps them"""
+        try:
+            if connection.vendor == "mysql":
+                cursor.execute(
+                    "SELECT index_name, stat_value * @@innodb_page_size "
+                    "FROM mysql.innodb_index_stats "
+                    "WHERE database_name = DATABASE() AND table_name = %s "
+                    "AND stat_name = 'size'",
+                    [table],
+                )
+            elif connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT indexname, pg_relation_size(quote_ident(indexname)::regclass) "
+                    "FROM pg_indexes WHERE tablename = %s",
+                    [table],
+                )
+            elif connection.vendor == "sqlite":
+                # Needs SQLite built with SQLITE_ENABLE_DBSTAT_VTAB
+                cursor.execute(
+                    "SELECT name, SUM(pgsize) FROM dbstat "
+                    "WHERE name IN (SELECT name FROM sqlite_master "
+                    "WHERE type = 'index' AND tbl_name = %s) GROUP BY name",
+                    [table],
+                )
+            else:
+                return {}
+            return {name: int(size) for name, size in cursor.fetchall()}
+        except DatabaseError:
+            return {}
+
+    def _format_size(self, size):
+        if size is None:
+            return "size unknown"
+        return f"{size / 2**20:.1f} MiB"
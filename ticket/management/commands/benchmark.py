@@ -0,0 +1,176 @@
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection
+
+from order.models import Order
+from ticket.models import Ticket
+from ticket.writers import WRITERS
+from user.models import User
+
+LOCAL_HOSTS = {"", "localhost", "127.0.0.1", "::1"}
+
+
+def int_list(value):
+    return [int(item) for item in value.split(",")]
+
+
+def writer_list(value):
+    writers = value.split(",")
+    unknown = set(writers) - set(WRITERS)
+    if unknown:
+        raise ValueError(f"unknown writers: {', '.join(sorted(unknown))}")
+    return writers
+
+
+class Command(BaseCommand):
+    help = "Benchmark seeding and token regeneration throughput on a local database"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--orders", type=int, default=10000)
+        parser.add_argument("--tickets", type=int, default=100000)
+        parser.add_argument(
+            "--seed", type=int, default=42, help="Seed for a reproducible dataset"
+        )
+        parser.add_argument(
+            "--skip-seed",
+            action="store_true",
+            help="Benchmark regenerate_tokens on the data already in the database",
+        )
+        parser.add_argument(
+            "--workers", type=int_list, default=[1, 2, 4], help="e.g. 1,2,4"
+        )
+        parser.add_argument(
+            "--batch-sizes", type=int_list, default=[1000], help="e.g. 500,1000,5000"
+        )
+        parser.add_argument(
+            "--writers",
+            type=writer_list,
+            default=["bulk_update"],
+            help=f"Any of {','.join(WRITERS)}",
+        )
+        parser.add_argument(
+            "--executor", choices=["thread", "process"], default="thread"
+        )
+        parser.add_argument(
+            "--output", help="Write the results to this JSON file instead of stdout"
+        )
+        parser.add_argument(
+            "--allow-remote",
+            action="store_true",
+            help="Run even though the database is not on this host",
+        )
+
+    def handle(self, *args, **options):
+        self._check_local_database(options["allow_remote"])
+        results = []
+
+        if not options["skip_seed"]:
+            self._reset_dataset()
+            for command, count in (
+                ("seed_users", options["users"]),
+                ("seed_orders", options["orders"]),
+                ("seed_tickets", options["tickets"]),
+            ):
+                result = self._run(
+                    command, f"--count={count}", f"--seed={options['seed']}"
+                )
+                result.update(rows=count, rows_per_second=count / result["seconds"])
+                results.append(result)
+
+        for workers, batch_size, writer in itertools.product(
+            options["workers"], options["batch_sizes"], options["writers"]
+        ):
+            results.append(
+                self._run_regenerate(workers, batch_size, writer, options["executor"])
+            )
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Wrote {len(results)} results to {options['output']}"
+                )
+            )
+        else:
+            self.stdout.write(output)
+
+    def _check_local_database(self, allow_remote):
+        """Refuse to reset or hammer anything but a local database"""
+        host = connection.settings_dict.get("HOST") or ""
+        if (
+            connection.vendor != "sqlite"
+            and host not in LOCAL_HOSTS
+            and not allow_remote
+        ):
+            raise CommandError(
+                f"Database host {host!r} is not local; pass --allow-remote to benchmark it"
+            )
+
+    def _reset_dataset(self):
+        """Empty the ticket, order and user tables so every benchmark seeds the same data"""
+        tables = [model._meta.db_table for model in (Ticket, Order, User)]
+        connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tables))
+
+    def _run_regenerate(self, workers, batch_size, writer, executor):
+        with tempfile.TemporaryDirectory() as tmp:
+            metrics_file = os.path.join(tmp, "metrics.json")
+            result = self._run(
+                "regenerate_tokens",
+                f"--workers={workers}",
+                f"--batch-size={batch_size}",
+                f"--writer={writer}",
+                f"--executor={executor}",
+                # Benchmark the configured batch size, not the adaptive one
+                "--target-commit-ms=0",
+                f"--metrics-file={metrics_file}",
+            )
+            with open(metrics_file) as f:
+                metrics = json.load(f)
+
+        result.update(
+            workers=workers,
+            batch_size=batch_size,
+            writer=writer,
+            executor=executor,
+            rows=metrics["rows"],
+            rows_per_second=metrics["rows_per_second"],
+            p50_batch_ms=metrics["p50_batch_ms"],
+            p99_batch_ms=metrics["p99_batch_ms"],
+        )
+        return result
+
+    def _run(self, command, *args):
+        """Run a management command in a child process and measure it
+
+        A child per run makes peak RSS attributable to that run alone.
+        """
+        self.stderr.write(f"Running {command} {' '.join(args)}")
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, str(settings.BASE_DIR / "manage.py"), command, *args],
+            stdout=subprocess.DEVNULL,
+        )
+        _, status, usage = os.wait4(process.pid, 0)
+        seconds = time.perf_counter() - start
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            raise CommandError(f"{command} exited with status {process.returncode}")
+
+        return {
+            "command": command,
+            "seconds": seconds,
+            # ru_maxrss is in kilobytes on Linux
+            "peak_rss_kb": usage.ru_maxrss,
+        }
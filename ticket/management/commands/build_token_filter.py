@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ticket.bloom import build_token_filter, publish_token_filter
+
+
+class Command(BaseCommand):
+    help = "Build the Bloom filter of live ticket tokens and publish it"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.001,
+            help="Target false-positive rate at the filter's capacity",
+        )
+        parser.add_argument(
+            "--headroom",
+            type=float,
+            default=2.0,
+            help="Capacity as a multiple of today's ticket count, leaving room "
+            "for the tokens a rotation adds before the next rebuild",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Rows fetched per round trip while streaming tokens",
+        )
+        parser.add_argument(
+            "--output",
+            help="Also write the snapshot to this file, for TOKEN_FILTER_PATH",
+        )
+        parser.add_argument(
+            "--no-publish",
+            action="store_true",
+            help="Only write --output; leave the snapshot in the cache as it is",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        bloom = build_token_filter(
+            options["error_rate"], options["headroom"], options["chunk_size"]
+        )
+        self.stdout.write(
+            f"Built a filter of {bloom.count} tokens in "
+            f"{time.perf_counter() - start:.1f}s: {len(bloom.bits) / 2**20:.1f} MiB, "
+            f"{bloom.hash_count} hashes"
+        )
+
+        if options["output"]:
+            bloom.save(options["output"])
+            self.stdout.write(f"Wrote the filter to {options['output']}")
+        if not options["no_publish"]:
+            publish_token_filter(bloom)
+            self.stdout.write(self.style.SUCCESS("Published the token filter"))
@@ -0,0 +1,70 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from utils.basemodel import convert_uuid_keys, uuid_key_columns
+
+
+class Command(BaseCommand):
+    help = (
+        "Convert the UUID key columns between char(32) and binary(16) on MySQL; "
+        "flip BINARY_UUID_KEYS to match once it finishes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--to", choices=["binary", "char"], required=True)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the statements instead of running them",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "mysql":
+            raise CommandError(
+                f"{connection.vendor} stores UUID keys the same way either way"
+            )
+        to_binary = options["to"] == "binary"
+        columns = uuid_key_columns(apps.get_models())
+
+        current = self._column_types(columns)
+        target = "binary" if to_binary else "char"
+        if set(current.values()) == {target}:
+            self.stdout.write(f"The UUID key columns are already {target}")
+            return
+        if len(set(current.values())) > 1:
+            raise CommandError(f"UUID key columns have mixed types: {current}")
+
+        self.stdout.write(
+            f"Converting {len(current)} columns in {len(columns)} tables to {target}; "
+            "stop every writer first, each table is rewritten"
+        )
+        with connection.schema_editor(
+            collect_sql=options["dry_run"], atomic=False
+        ) as editor:
+            convert_uuid_keys(editor, list(columns), to_binary)
+        if options["dry_run"]:
+            self.stdout.write("\n".join(editor.collected_sql))
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Converted; set BINARY_UUID_KEYS={'true' if to_binary else 'false'} "
+                "and restart"
+            )
+        )
+
+    def _column_types(self, columns):
+        """{table.column: data type} of every UUID key column, from the live schema"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT table_name, column_name, data_type "
+                "FROM information_schema.columns WHERE table_schema = DATABASE()"
+            )
+            types = {(table, column): data_type for table, column, data_type in cursor}
+        return {
+            f"{model._meta.db_table}.{field.column}": types.get(
+                (model._meta.db_table, field.column)
+            )
+            for model, fields in columns.items()
+            for field in fields
+        }
@@ -1,33 +1,77 @@
-import uuid
+import functools
+import json
+import multiprocessing
+import os
+import queue
+import random
+import statistics
 import time
 import threading
-from datetime import timedelta
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from django.core.management.base import BaseCommand
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from django.core.cache import cache
-from django.db import transaction
-from django.db.models import Min, Max
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Trunc
 from django.utils import timezone
-from ticket.models import Ticket
+from ticket.bloom import (
+    VERSION_KEY,
+    build_token_filter,
+    publish_token_filter,
+    publish_tokens,
+)
+from ticket.governor import BatchGovernor, RateLimiter, is_lock_wait
+from ticket.lookup import invalidate_tokens
+from ticket.leases import LeaseLost, LocalLeaseStore, RangeLeases, lease_store
+from ticket.metrics import (
+    RunMetrics,
+    StackSampler,
+    render_prometheus,
+    write_atomically,
+)
+from ticket.models import RotationJob, RotationRange, Ticket
+from ticket.progress import ProgressCounters
+from ticket.tokens import TOKEN_STRATEGIES, get_token_generator
+from ticket.writers import WRITERS, get_writer
+from utils.dbrouter import use_primary
+from utils.mysql_pool.base import pool_stats
+from utils.process import setup_django
 import sys
 
 
 class Command(BaseCommand):
     help = "Regenerate ticket tokens using time-based sharding"
 
+    max_write_attempts = 5
+
     def __init__(self):
         super().__init__()
         self.stop_monitoring = threading.Event()
-        self.processed_lock = threading.Lock()
         self.stdout_lock = threading.Lock()
-        self.is_resume = False
+        self.manager = None
+        # Rows a resumed job had committed before this run
+        self.resumed_rows = 0
+        self.options = {}
+        self.writer = None
+        self.token_generator = None
+        self.rate_limiter = None
+        self.prefetch_pages = 2
+        self.progress = None
+        # This host's range leases in --distributed mode
+        self.leases = None
+        # Per worker list of (rows, commit seconds), one entry per batch
+        self.batches = {}
+        # Per worker stage histograms, shared with its reader thread
+        self.metrics = {}
+        self.metrics_published_at = {}
 
     def add_arguments(self, parser):
         parser.add_argument(
             "--batch-size",
             type=int,
             default=1000,
-            help="Number of tickets to process in each batch",
+            help="Number of tickets in each worker's first batch",
         )
         parser.add_argument(
             "--workers",
@@ -36,7 +80,134 @@ class Command(BaseCommand):
             help="Number of workers to process tickets in parallel",
         )
         parser.add_argument(
-            "--resume", action="store_true", help="Resume from the last saved position"
+            "--resume",
+            action="store_true",
+            help="Resume the latest unfinished job, skipping its completed ranges; "
+            "--workers may differ from the interrupted run",
+        )
+        parser.add_argument(
+            "--job",
+            type=int,
+            help="Resume this job instead of the latest unfinished one",
+        )
+        parser.add_argument(
+            "--distributed",
+            action="store_true",
+            help="Share the job with other hosts: claim its ranges through "
+            "expiring Redis leases instead of queueing all of them here; "
+            "other hosts join with --distributed --job=<job id>",
+        )
+        parser.add_argument(
+            "--lease-seconds",
+            type=float,
+            default=30.0,
+            help="How long a range lease outlives its host's last heartbeat "
+            "before another host may reclaim the range",
+        )
+        parser.add_argument(
+            "--ranges-per-worker",
+            type=int,
+            default=8,
+            help="Number of count-balanced ranges to plan per worker for work stealing",
+        )
+        parser.add_argument(
+            "--plan-granularity",
+            choices=["second", "minute", "hour", "day"],
+            default="minute",
+            help="Width of the created_at buckets in the planning histogram",
+        )
+        parser.add_argument(
+            "--plan-sample-digits",
+            type=int,
+            default=0,
+            help="Estimate the plan from tickets whose id ends in this many "
+            "zero hex digits (1/16 of rows per digit); 0 plans exactly",
+        )
+        parser.add_argument(
+            "--metrics-file",
+            help="Write rows/sec, batch latency percentiles, per-stage latency "
+            "histograms and queries per batch of the run; rewritten every "
+            "--metrics-interval seconds while it runs",
+        )
+        parser.add_argument(
+            "--metrics-format",
+            choices=["json", "prometheus"],
+            default="json",
+            help="JSON, or Prometheus text for the node_exporter textfile collector",
+        )
+        parser.add_argument(
+            "--metrics-interval",
+            type=float,
+            default=10.0,
+            help="Seconds between metrics file updates during the run; 0 only "
+            "writes it at the end",
+        )
+        parser.add_argument(
+            "--sample-stacks",
+            help="Sample every thread's stack and write collapsed stacks for a "
+            "flame graph to this file; process workers write FILE.<worker id>",
+        )
+        parser.add_argument(
+            "--sample-interval",
+            type=float,
+            default=0.01,
+            help="Seconds between stack samples of --sample-stacks",
+        )
+        parser.add_argument(
+            "--executor",
+            choices=["thread", "process"],
+            default="thread",
+            help="Run workers as threads, or as processes that each own "
+            "their Django setup and DB connection",
+        )
+        parser.add_argument(
+            "--target-commit-ms",
+            type=int,
+            default=250,
+            help="Commit latency each worker steers its batch size and pause "
+            "towards; 0 keeps --batch-size and the pause fixed",
+        )
+        parser.add_argument(
+            "--min-batch-size",
+            type=int,
+            default=100,
+            help="Smallest batch the adaptive batch size may shrink to",
+        )
+        parser.add_argument(
+            "--max-batch-size",
+            type=int,
+            default=10000,
+            help="Largest batch the adaptive batch size may grow to",
+        )
+        parser.add_argument(
+            "--max-rows-per-second",
+            type=int,
+            default=0,
+            help="Write budget shared by all workers through Redis; 0 is unlimited",
+        )
+        parser.add_argument(
+            "--prefetch-pages",
+            type=int,
+            default=2,
+            help="Number of pages each worker's reader may fetch ahead of its writer",
+        )
+        parser.add_argument(
+            "--token-strategy",
+            choices=list(TOKEN_STRATEGIES),
+            default="hex",
+            help="How new tokens are generated: random hex, shorter random "
+            "base32, or an HMAC of the ticket id for reproducible reruns",
+        )
+        parser.add_argument(
+            "--token-seed",
+            default="",
+            help="Seed mixed into the HMAC key of the hmac token strategy",
+        )
+        parser.add_argument(
+            "--writer",
+            choices=list(WRITERS),
+            default="bulk_update",
+            help="Strategy used to write each batch of new tokens",
         )
 
     def _monitor_progress(self, total_tickets):
@@ -44,23 +215,26 @@ class Command(BaseCommand):
         start_time = time.time()
         last_processed = 0
         last_time = start_time
+        last_metrics_write = start_time
+        metrics_interval = self.options["metrics_interval"]
 
         while not self.stop_monitoring.is_set():
             try:
                 time.sleep(0.5)
                 current_time = time.time()
 
-                # Get progress data with thread safety
-                worker_counts = self._get_worker_counts()
-                total_processed = sum(worker_counts.values())
+                # One read of every worker's counters per tick
+                worker_counts = self._get_worker_counts(self.progress.read())
+                processed = sum(worker_counts.values())
+                total_processed = self.resumed_rows + processed
 
                 # Calculate processing speed and ETA
                 elapsed = current_time - start_time
-                speed = total_processed / elapsed if elapsed > 0 else 0
+                speed = processed / elapsed if elapsed > 0 else 0
 
                 # Calculate recent speed for more accurate ETA
                 last_processed, last_time = self._calculate_recent_speed(
-                    total_processed, last_processed, last_time, current_time
+                    processed, last_processed, last_time, current_time
                 )
 
                 # Estimate remaining time
@@ -76,17 +250,24 @@ class Command(BaseCommand):
                     total_processed, total_tickets, speed, eta_str, worker_status
                 )
 
+                if (
+                    self.options["metrics_file"]
+                    and metrics_interval > 0
+                    and current_time - last_metrics_write >= metrics_interval
+                ):
+                    last_metrics_write = current_time
+                    self._write_metrics(self.options["metrics_file"], elapsed)
+
             except Exception as e:
                 self.stderr.write(f"\nMonitor error: {str(e)}")
                 break
 
-    def _get_worker_counts(self):
-        """Retrieve processed counts for all workers in a thread-safe manner"""
-        with self.processed_lock:
-            return {
-                i: cache.get(f"worker_{i}_processed_count", 0)
-                for i in range(self.worker_count)
-            }
+    def _get_worker_counts(self, progress):
+        """Processed count of each worker, from one read of the progress counters"""
+        return {
+            worker_id: progress.get(worker_id, {}).get("processed", 0)
+            for worker_id in range(self.worker_count)
+        }
 
     def _calculate_recent_speed(
         self, total_processed, last_processed, last_time, current_time
@@ -131,174 +312,527 @@ class Command(BaseCommand):
         )
         sys.stdout.flush()
 
-    def _process_time_chunk(
+    def _run_worker(self, worker_id, batch_size, range_queue):
+        """Pull ranges off the shared queue, or lease them, until none is left"""
+        # Counts, timings and metrics cover this run; the job's ranges
+        # carry the progress across runs
+        total_processed = 0
+        self.batches[worker_id] = []
+        self.metrics[worker_id] = RunMetrics()
+        governor = BatchGovernor(
+            batch_size,
+            min_batch_size=self.options["min_batch_size"],
+            max_batch_size=self.options["max_batch_size"],
+            target_latency=self.options["target_commit_ms"] / 1000,
+        )
+        try:
+            while True:
+                next_range = self._next_range(range_queue)
+                if next_range is None:
+                    return total_processed, self.batches[worker_id]
+                range_id, range_start, range_end, cursor = next_range
+
+                total_processed = self._process_range(
+                    worker_id,
+                    range_id,
+                    range_start,
+                    range_end,
+                    cursor,
+                    governor,
+                    total_processed,
+                )
+        finally:
+            self._publish_metrics(worker_id, force=True)
+            # Hand this thread's connection back to the pool for the others
+            connections.close_all()
+
+    def _process_range(
         self,
         worker_id,
-        batch_size,
-        time_boundaries,
+        range_id,
+        range_start,
+        range_end,
+        cursor,
+        governor,
+        total_processed,
     ):
-        """Process tickets within a specific time range chunk"""
-        total_processed = (
-            cache.get(f"worker_{worker_id}_processed_count", 0) if self.is_resume else 0
-        )
-        last_created_at = (
-            cache.get(f"worker_{worker_id}_last_created_at") if self.is_resume else None
-        )
+        """Process tickets within a single planned range, one keyset page at a time
 
-        chunk_start, chunk_end = time_boundaries[worker_id]
-        processed = 0
-        updates = []
+        Starts after cursor, the range's checkpoint when it is resumed. A
+        reader thread prefetches pages into a bounded queue on its own
+        connection while this thread generates tokens and commits the
+        previous page, so reads and writes overlap.
+        """
+        metrics = self.metrics[worker_id]
+        pages = queue.Queue(maxsize=max(1, self.prefetch_pages))
+        stop_reading = threading.Event()
 
         try:
-            query = self._get_query_by_timerange(
-                chunk_start=chunk_start,
-                chunk_end=chunk_end,
+            query = self._get_query_by_range(
+                range_start=range_start,
+                range_end=range_end,
+            )
+            reader = threading.Thread(
+                target=self._read_pages,
+                args=(query, cursor, governor, pages, stop_reading, metrics),
+                name=f"reader-{worker_id}",
+                daemon=True,
             )
+            reader.start()
 
-            if last_created_at:
-                query = query.filter(created_at__gt=last_created_at)
+            while True:
+                with metrics.stage("queue_wait"):
+                    page = pages.get()
+                if page is None:
+                    break
+                if isinstance(page, Exception):
+                    raise page
 
-            for ticket in (
-                query.order_by("created_at").values("id", "created_at").iterator()
-            ):
-                updates.append(
-                    Ticket(
-                        id=ticket["id"],
-                        token=uuid.uuid4().hex,
-                        updated_at=timezone.now(),
-                    )
-                )
-                processed += 1
-                last_created_at = ticket["created_at"]
-
-                if len(updates) >= batch_size:
-                    total_processed = self._bulk_update_tickets(
-                        updates, worker_id, total_processed, last_created_at
-                    )
-                    updates = []
-                    time.sleep(0.01)  # Reduced sleep time
+                with metrics.stage("build"):
+                    updates = self._build_updates(page)
+                last_id, last_created_at, _, _ = page[-1]
+                cursor = (last_created_at, last_id)
 
-            if updates:
-                self._bulk_update_tickets(
-                    updates, worker_id, total_processed, last_created_at
+                # Each page commits together with its checkpoint, so an
+                # interrupted range resumes from the last committed page
+                total_processed = self._write_page(
+                    updates, worker_id, range_id, total_processed, cursor, governor
                 )
-                total_processed += len(updates)
+                with metrics.stage("sync"):
+                    self._sync_lookups(page, updates)
+                self._publish_metrics(worker_id)
+                with metrics.stage("pause"):
+                    time.sleep(governor.pause)
 
-        except KeyboardInterrupt:
-            self._bulk_update_tickets(
-                updates, worker_id, total_processed, last_created_at
-            )
-            raise
+            if not self._range_checkpoint(range_id).update(completed_at=timezone.now()):
+                raise LeaseLost(f"Range {range_id} was reclaimed by another host")
+
+        except LeaseLost as e:
+            self.stderr.write(f"Worker {worker_id}: {e}; leaving it to that host")
 
         except Exception as e:
-            self.stderr.write(f"Worker {worker_id} error: {str(e)}")
+            self.stderr.write(f"Worker {worker_id} error on range {range_id}: {str(e)}")
             raise
 
+        finally:
+            stop_reading.set()
+            if self.leases is not None:
+                self.leases.release(range_id)
+
         return total_processed
 
-    def _get_query_by_timerange(self, *, chunk_start, chunk_end):
-        return self._get_base_query().filter(
-            created_at__gte=chunk_start,
-            created_at__lt=chunk_end,
+    def _next_range(self, range_queue):
+        """The next (range id, start, end, cursor) to process; None once none is left"""
+        if self.leases is None:
+            try:
+                return range_queue.get_nowait()
+            except queue.Empty:
+                return None
+        return self._claim_range()
+
+    def _claim_range(self):
+        """Lease one of the job's unfinished ranges, waiting while others hold them all
+
+        A range whose host stopped heartbeating is claimed again once its
+        lease expires, and resumes from the last checkpoint that host
+        committed.
+        """
+        while True:
+            with use_primary():
+                pending = list(
+                    RotationRange.objects.filter(
+                        job_id=self.leases.job_id, completed_at__isnull=True
+                    ).values_list("pk", flat=True)
+                )
+            if not pending:
+                return None
+            # Workers of every host start at different ranges
+            random.shuffle(pending)
+            for range_id in pending:
+                token = self.leases.claim(range_id)
+                if token is None:
+                    continue
+                # Fence out the previous holder, then read the checkpoint it
+                # left; its update waits for any batch it is still committing.
+                # Tokens only grow, so a claim that stalled past its lease
+                # cannot fence out the later claim that reclaimed the range
+                if not RotationRange.objects.filter(
+                    Q(lease_token__isnull=True) | Q(lease_token__lt=token),
+                    pk=range_id,
+                ).update(lease_token=token):
+                    self.leases.release(range_id)
+                    continue
+                with use_primary():
+                    planned = RotationRange.objects.get(pk=range_id)
+                if planned.completed_at is not None:
+                    self.leases.release(range_id)
+                    continue
+                return planned.pk, planned.start, planned.end, planned.cursor
+            time.sleep(self.leases.ttl / 3)
+
+    def _range_checkpoint(self, range_id):
+        """The range's checkpoint row, fenced by this host's lease in --distributed mode"""
+        checkpoint = RotationRange.objects.filter(pk=range_id)
+        if self.leases is not None:
+            checkpoint = checkpoint.filter(lease_token=self.leases.token(range_id))
+        return checkpoint
+
+    def _build_updates(self, page):
+        """Build the batch's Ticket updates with one token call and one timestamp"""
+        tokens = self.token_generator.generate(
+            [ticket_id for ticket_id, _, _, _ in page]
+        )
+        updated_at = timezone.now()
+        return [
+            Ticket(id=ticket_id, order_id=order_id, token=token, updated_at=updated_at)
+            for (ticket_id, _, order_id, _), token in zip(page, tokens)
+        ]
+
+    def _sync_lookups(self, page, updates):
+        """Forget the committed page's old tokens and publish its new ones"""
+        invalidate_tokens(
+            old_token
+            for (_, _, _, old_token), ticket in zip(page, updates)
+            # A seeded hmac rerun can hand a ticket its current token again
+            if old_token != ticket.token
         )
+        publish_tokens([ticket.token for ticket in updates])
+
+    def _write_page(
+        self, updates, worker_id, range_id, total_processed, cursor, governor
+    ):
+        """Write one page within the rate budget, retrying it after lock waits"""
+        metrics = self.metrics[worker_id]
+        queries = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        with connections[DEFAULT_DB_ALIAS].execute_wrapper(count_query):
+            for attempt in range(1, self.max_write_attempts + 1):
+                with metrics.stage("throttle"):
+                    self.rate_limiter.acquire(len(updates))
+                commit_start = time.perf_counter()
+                try:
+                    total_processed = self._bulk_update_tickets(
+                        updates, worker_id, range_id, total_processed, cursor
+                    )
+                except OperationalError as e:
+                    if not is_lock_wait(e) or attempt == self.max_write_attempts:
+                        raise
+                    governor.record_lock_wait()
+                    time.sleep(governor.pause)
+                    continue
+                commit_seconds = time.perf_counter() - commit_start
+                governor.record_commit(commit_seconds)
+                metrics.observe("transaction", commit_seconds)
+                # Retried attempts count too: they are load on the primary
+                metrics.observe_batch(len(updates), queries)
+                self.batches[worker_id].append((len(updates), commit_seconds))
+                return total_processed
+
+    def _read_pages(self, query, cursor, governor, pages, stop_reading, metrics):
+        """Producer stage: fetch keyset pages ahead of the writer
+
+        Pages are sized by the worker's governor as they are fetched. Ends
+        the stream with None, or with the exception that stopped it.
+        """
+        try:
+            while not stop_reading.is_set():
+                page_size = governor.batch_size
+                with metrics.stage("scan"):
+                    page = self._fetch_page(query, cursor, page_size)
+                if page:
+                    self._put_page(pages, page, stop_reading)
+                if len(page) < page_size:
+                    break
+                last_id, last_created_at, _, _ = page[-1]
+                cursor = (last_created_at, last_id)
+            self._put_page(pages, None, stop_reading)
+        except Exception as e:
+            self._put_page(pages, e, stop_reading)
+        finally:
+            # Django opened connections for this thread, to the replica it
+            # reads from among them; release them with the thread
+            connections.close_all()
+
+    def _put_page(self, pages, page, stop_reading):
+        """Block on the bounded queue, but give up once the writer has stopped"""
+        while not stop_reading.is_set():
+            try:
+                pages.put(page, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _fetch_page(self, query, cursor, page_size):
+        """Fetch the next page of (id, created_at, order_id, token) rows after the cursor
+
+        The ticket's columns all come from its (created_at, id, ...) covering
+        index; only the order/user join reaches other tables.
+        """
+        if cursor is not None:
+            last_created_at, last_id = cursor
+            # The leading created_at__gte bound gives MySQL an index range seek;
+            # the OR only breaks ties between rows sharing a timestamp
+            query = query.filter(
+                Q(created_at__gt=last_created_at) | Q(id__gt=last_id),
+                created_at__gte=last_created_at,
+            )
+        return list(
+            query.order_by("created_at", "id").values_list(
+                "id", "created_at", "order_id", "token"
+            )[:page_size]
+        )
+
+    def _get_query_by_range(self, *, range_start, range_end):
+        """Restrict the base query to keys in [range_start, range_end)
+
+        Bounds are (created_at, id) keys, or None for an open end, so a burst
+        of tickets sharing one timestamp can still be split across ranges.
+        A bound with id None sits before every ticket at that created_at.
+        """
+        query = self._get_base_query()
+        if range_start is not None:
+            start_created_at, start_id = range_start
+            query = query.filter(created_at__gte=start_created_at)
+            if start_id is not None:
+                query = query.filter(
+                    Q(created_at__gt=start_created_at) | Q(id__gte=start_id)
+                )
+        if range_end is not None:
+            end_created_at, end_id = range_end
+            if end_id is None:
+                query = query.filter(created_at__lt=end_created_at)
+            else:
+                query = query.filter(
+                    Q(created_at__lt=end_created_at) | Q(id__lt=end_id),
+                    created_at__lte=end_created_at,
+                )
+        return query
 
     def _get_base_query(self):
         """Get the base query for tickets within the specified time range"""
         return Ticket.objects.filter(
-            order__deleted_at__isnull=True,
-            order__user__deleted_at__isnull=True,
-            order__user__email__endswith="@example.com",
+            ancestors_alive=True,
+            order__user__email_domain="example.com",
             # order__user__id="3a1a185b219d412a9ea9f14ab1582065",
         )
 
     def _bulk_update_tickets(
-        self, updates, worker_id, total_processed, last_created_at
+        self, updates, worker_id, range_id, total_processed, cursor
     ):
-        """Perform bulk update of tickets and update cache"""
+        """Write the tickets and the range's checkpoint in one transaction"""
+        metrics = self.metrics[worker_id]
         if updates:
             with transaction.atomic():
-                Ticket.objects.bulk_update(updates, fields=["token", "updated_at"])
-                with self.processed_lock:
-                    total_processed += len(updates)
-                    cache.set(
-                        f"worker_{worker_id}_processed_count", total_processed, 86400
-                    )
-                    cache.set(
-                        f"worker_{worker_id}_last_created_at", last_created_at, 86400
-                    )
+                write_start = time.perf_counter()
+                self.writer.write(updates)
+                write_seconds = time.perf_counter() - write_start
+                metrics.observe("write", write_seconds)
+                checkpoint_start = time.perf_counter()
+                cursor_created_at, cursor_id = cursor
+                # A reclaimed range rolls back the batch instead of rotating it twice
+                if not self._range_checkpoint(range_id).update(
+                    cursor_created_at=cursor_created_at,
+                    cursor_id=cursor_id,
+                    processed=F("processed") + len(updates),
+                ):
+                    raise LeaseLost(f"Range {range_id} was reclaimed by another host")
+                commit_start = time.perf_counter()
+                metrics.observe("checkpoint", commit_start - checkpoint_start)
+            metrics.observe("commit", time.perf_counter() - commit_start)
+            total_processed += len(updates)
+            # Progress display only, counted once committed
+            self.progress.add(
+                worker_id,
+                processed=len(updates),
+                write_us=round(write_seconds * 1_000_000),
+            )
         return total_processed
 
-    def handle(self, *args, **options):
-        self.worker_count = options["workers"]
-        batch_size = options["batch_size"]
-        resume = options["resume"]
+    def _plan_ranges(self, base_query, range_count, granularity):
+        """Plan count-balanced ranges from one grouped, time-bucketed scan
 
-        try:
-            # Base query to filter tickets
-            base_query = self._get_base_query()
-            total_tickets = base_query.count()
-            self.stdout.write(f"Initial count: {total_tickets}")
+        Returns the total ticket count and the ranges. Buckets are merged
+        until a range holds its share of rows; only a bucket that alone
+        exceeds a share is split further, by keyset seeks inside that bucket.
+        """
+        histogram = list(
+            base_query.annotate(bucket=Trunc("created_at", granularity))
+            .values_list("bucket")
+            .annotate(rows=Count("id"))
+            .order_by("bucket")
+        )
+        total_tickets = sum(rows for _, rows in histogram)
+        target = max(1, -(-total_tickets // range_count))
 
-            if total_tickets == 0:
-                self.stdout.write(self.style.SUCCESS("No tickets to process"))
-                return
+        boundaries = [None]
+        accumulated = 0
+        for index, (bucket, rows) in enumerate(histogram):
+            if accumulated and accumulated + rows > target:
+                boundaries.append((bucket, None))
+                accumulated = 0
+            if rows <= target:
+                accumulated += rows
+                continue
 
-            # Calculate time boundaries
-            time_range = base_query.aggregate(
-                min_time=Min("created_at"), max_time=Max("created_at")
+            # A hot bucket, e.g. a burst seeded within one second
+            next_bucket = (
+                histogram[index + 1][0] if index + 1 < len(histogram) else None
             )
-            min_time = time_range["min_time"]
-            max_time = time_range["max_time"]
+            bucket_query = base_query.filter(created_at__gte=bucket)
+            if next_bucket is not None:
+                bucket_query = bucket_query.filter(created_at__lt=next_bucket)
+            ordered = bucket_query.order_by("created_at", "id").values_list(
+                "created_at", "id"
+            )
+            for offset in range(target, rows, target):
+                boundaries.append(ordered[offset])
+            accumulated = rows - (rows - 1) // target * target
+        boundaries.append(None)
 
-            # Calculate time chunks
-            time_span = (max_time - min_time).total_seconds()
-            chunk_seconds = time_span / self.worker_count
+        return total_tickets, self._ranges_from_boundaries(boundaries)
 
-            # Calculate time boundaries and store expected counts
-            time_boundaries = []
-            for worker_id in range(self.worker_count):
-                chunk_start = min_time + timedelta(seconds=chunk_seconds * worker_id)
-                chunk_end = min_time + timedelta(
-                    seconds=chunk_seconds * (worker_id + 1)
-                )
-                if worker_id == self.worker_count - 1:
-                    chunk_end = max_time + timedelta(seconds=1)
+    def _plan_sampled_ranges(self, base_query, range_count, sample_digits):
+        """Estimate count-balanced ranges from the tickets whose id ends in zeros
 
-                # Calculate expected count for this worker
-                expected_count = base_query.filter(
-                    created_at__gte=chunk_start, created_at__lt=chunk_end
-                ).count()
+        UUID4 ids are uniformly random, so each trailing hex digit keeps 1/16
+        of the rows. The suffix is checked on the covering index alone and
+        only the sampled rows reach the order/user join. A suffix rather than
+        a prefix keeps the sample unbiased within a burst sharing one
+        timestamp, where rows are ordered by id.
 
-                self.stdout.write(
-                    f"Worker {worker_id} expected count: {expected_count}"
+        Returns None when the sample is too small to place a boundary per
+        range, or to tell an empty table from a small one.
+        """
+        sample = list(
+            base_query.filter(id__endswith="0" * sample_digits)
+            .order_by("created_at", "id")
+            .values_list("created_at", "id")
+        )
+        if len(sample) < range_count:
+            return None
+        total_tickets = len(sample) * 16**sample_digits
+
+        boundaries = [None]
+        for k in range(1, range_count):
+            boundary = sample[len(sample) * k // range_count] if sample else None
+            # Skip repeated quantiles when the sample is smaller than the plan
+            if boundary is not None and boundary != boundaries[-1]:
+                boundaries.append(boundary)
+        boundaries.append(None)
+
+        return total_tickets, self._ranges_from_boundaries(boundaries)
+
+    def _ranges_from_boundaries(self, boundaries):
+        return [
+            (range_id, range_start, range_end)
+            for range_id, (range_start, range_end) in enumerate(
+                zip(boundaries, boundaries[1:])
+            )
+        ]
+
+    def handle(self, *args, **options):
+        self.worker_count = options["workers"]
+        batch_size = options["batch_size"]
+        self._configure(options)
+        range_count = self.worker_count * options["ranges_per_worker"]
+
+        try:
+            if (
+                options["distributed"]
+                and options["executor"] == "process"
+                and isinstance(lease_store(), LocalLeaseStore)
+            ):
+                raise CommandError(
+                    "Without a Redis cache, leases are only shared by threads; "
+                    "use --executor=thread"
                 )
-                time_boundaries.append((chunk_start, chunk_end))
 
-                # Store expected count in cache and initialize processed count
-                cache.set(f"worker_{worker_id}_expected_count", expected_count, 86400)
+            job = None
+            if options["resume"] or options["job"] is not None:
+                job = self._find_job(options["job"])
+            if job is None:
+                total_tickets, ranges = self._create_plan(options, range_count)
+                self.stdout.write(f"Initial count: {total_tickets}")
+                # The count may be an estimate; only an exact check skips the run
+                if total_tickets == 0 and not self._get_base_query().exists():
+                    self.stdout.write(self.style.SUCCESS("No tickets to process"))
+                    return
+                job = self._create_job(total_tickets, ranges)
+                self.stdout.write(
+                    f"Planned job {job.pk}: {len(ranges)} ranges of "
+                    f"~{total_tickets // len(ranges)} tickets"
+                )
+                if options["distributed"]:
+                    self.stdout.write(
+                        f"Other hosts join with --distributed --job={job.pk}"
+                    )
+            total_tickets = job.total_tickets
 
+            # The checkpoints were just committed on the primary
+            with use_primary():
+                pending = list(
+                    job.ranges.filter(completed_at__isnull=True).order_by("number")
+                )
+                self.resumed_rows = (
+                    job.ranges.aggregate(rows=Sum("processed"))["rows"] or 0
+                )
+            if self.resumed_rows:
+                self.stdout.write(
+                    f"Resuming job {job.pk}: {len(pending)} ranges left, "
+                    f"{self.resumed_rows} tickets already processed"
+                )
             self.stdout.write(
                 f"Starting to process {total_tickets} tickets with {self.worker_count} workers"
             )
 
-            # Initialize worker caches based on resume option
-            self._initialize_worker_caches(resume)
+            if options["distributed"]:
+                self.leases = RangeLeases(job.pk, options["lease_seconds"])
+
+            owner = self.leases.owner if self.leases is not None else None
+            self.progress = ProgressCounters(job.pk, self.worker_count, host=owner)
+            # Counts and metrics cover this run; the ranges carry the job's progress
+            self.progress.reset()
+
+            executor, range_queue, run_worker = self._create_executor(
+                options["executor"], job.pk, owner
+            )
+
+            # Idle workers steal the next pending range from the shared queue;
+            # distributed workers lease them instead
+            if self.leases is None:
+                for planned in pending:
+                    range_queue.put(
+                        (planned.pk, planned.start, planned.end, planned.cursor)
+                    )
 
             # Start progress monitor in the main thread
             monitor_thread = threading.Thread(
-                target=self._monitor_progress, args=(total_tickets,)
+                target=self._monitor_progress, args=(total_tickets,), name="monitor"
             )
             monitor_thread.daemon = True
             monitor_thread.start()
 
+            # Process workers sample themselves; see _run_process_worker
+            sampler = None
+            if options["sample_stacks"] and options["executor"] == "thread":
+                sampler = StackSampler(options["sample_interval"])
+                sampler.start()
+
             # Process tickets with multiple workers
-            with ThreadPoolExecutor(max_workers=self.worker_count) as executor:
+            batches = []
+            run_start = time.perf_counter()
+            with executor:
                 future_to_worker = {
                     executor.submit(
-                        self._process_time_chunk,
+                        run_worker,
                         worker_id,
                         batch_size,
-                        time_boundaries,
+                        range_queue,
                     ): worker_id
                     for worker_id in range(self.worker_count)
                 }
@@ -307,7 +841,8 @@ class Command(BaseCommand):
                     for future in as_completed(future_to_worker):
                         worker_id = future_to_worker[future]
                         try:
-                            future.result()
+                            _, worker_batches = future.result()
+                            batches.extend(worker_batches)
                         except Exception as e:
                             self.stderr.write(
                                 f"Worker {worker_id} failed with error: {str(e)}"
@@ -317,6 +852,19 @@ class Command(BaseCommand):
                     self.stop_monitoring.set()  # Signal monitor to stop
                     executor.shutdown(wait=True, cancel_futures=True)
 
+            run_seconds = time.perf_counter() - run_start
+            if self.leases is not None:
+                self.leases.stop()
+            if sampler is not None:
+                sampler.stop()
+                sampler.write(options["sample_stacks"])
+                self.stdout.write(
+                    f"Wrote {sampler.samples} stack samples to "
+                    f"{options['sample_stacks']}"
+                )
+            if self.manager is not None:
+                self.manager.shutdown()
+
             time.sleep(2)  # Wait for monitor to print the final progress
             # Wait for monitor to finish
             self.stop_monitoring.set()
@@ -324,14 +872,22 @@ class Command(BaseCommand):
 
             # Print final statistics with lock
             self.stdout.write("\nFinal processing statistics:")
-            with self.processed_lock:
-                for worker_id in range(self.worker_count):
-                    processed = cache.get(f"worker_{worker_id}_processed_count", 0)
-                    expected = cache.get(f"worker_{worker_id}_expected_count", 0)
-                    percentage = (processed / expected * 100) if expected > 0 else 0
-                    self.stdout.write(
-                        f"Worker {worker_id}: {processed} records ({percentage:.1f}% of expected share)"
-                    )
+            progress = self.progress.read()
+            worker_counts = self._get_worker_counts(progress)
+            for worker_id in range(self.worker_count):
+                processed = worker_counts[worker_id]
+                percentage = processed / total_tickets * 100
+                self.stdout.write(
+                    f"Worker {worker_id}: {processed} records ({percentage:.1f}% of total)"
+                )
+            self._report_write_throughput(options["writer"], progress)
+            self._report_pool_waits()
+            if options["metrics_file"]:
+                self._write_metrics(options["metrics_file"], run_seconds, batches)
+            # Of the hosts sharing a job, the one that marks it finished
+            # rebuilds the filter
+            if self._finish_job(job):
+                self._rebuild_token_filter()
 
         except Exception as e:
             self.stderr.write(f"Command failed: {str(e)}")
@@ -340,20 +896,254 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.SUCCESS("Token regeneration completed"))
 
-    def _initialize_worker_caches(self, resume):
-        """Initialize worker caches based on whether resuming or starting fresh"""
-        if resume:
-            self.stdout.write("Resuming from last saved position...")
-            for worker_id in range(self.worker_count):
-                self.is_resume = True
-                # Retrieve the processed count from cache just for debugging
-                # processed_count = cache.get(f"worker_{worker_id}_processed_count", 0)
-                # last_created_at = cache.get(f"worker_{worker_id}_last_created_at", None)
-                # self.stdout.write(f"Worker {worker_id} has processed {processed_count} tickets.")
-                # self.stdout.write(f"Worker {worker_id} last_created_at: {last_created_at}")
+    def _find_job(self, job_id):
+        """The job to resume: job_id, else the latest unfinished one, if any"""
+        with use_primary():
+            if job_id is not None:
+                try:
+                    job = RotationJob.objects.get(pk=job_id)
+                except RotationJob.DoesNotExist:
+                    raise CommandError(f"Job {job_id} does not exist")
+                if job.finished_at is not None:
+                    raise CommandError(f"Job {job_id} finished at {job.finished_at}")
+                return job
+            job = (
+                RotationJob.objects.filter(finished_at__isnull=True)
+                .order_by("-pk")
+                .first()
+            )
+        if job is None:
+            self.stdout.write("No unfinished job found, planning afresh")
+        return job
 
+    def _create_job(self, total_tickets, ranges):
+        """Save the plan as a job with one checkpoint row per range"""
+        with transaction.atomic():
+            job = RotationJob.objects.create(total_tickets=total_tickets)
+            RotationRange.objects.bulk_create(
+                RotationRange(
+                    job=job,
+                    number=number,
+                    start_created_at=range_start[0] if range_start else None,
+                    start_id=range_start[1] if range_start else None,
+                    end_created_at=range_end[0] if range_end else None,
+                    end_id=range_end[1] if range_end else None,
+                )
+                for number, range_start, range_end in ranges
+            )
+        return job
+
+    def _finish_job(self, job):
+        """Mark the job finished once every range is; False if another host did"""
+        with use_primary():
+            if job.ranges.filter(completed_at__isnull=True).exists():
+                raise CommandError(
+                    f"Job {job.pk} has unfinished ranges; rerun with --job={job.pk}"
+                )
+        return bool(
+            RotationJob.objects.filter(pk=job.pk, finished_at__isnull=True).update(
+                finished_at=timezone.now()
+            )
+        )
+
+    def _rebuild_token_filter(self):
+        """Republish a published token filter without the rotated-away tokens"""
+        if cache.get(VERSION_KEY) is None:
+            return
+        self.stdout.write("Rebuilding the token filter...")
+        bloom = build_token_filter()
+        publish_token_filter(bloom)
+        self.stdout.write(f"Published a token filter of {bloom.count} tokens")
+
+    def _create_plan(self, options, range_count):
+        """Plan the run's ranges with the exact or the sampled planner"""
+        base_query = self._get_base_query()
+        if options["plan_sample_digits"]:
+            plan = self._plan_sampled_ranges(
+                base_query, range_count, options["plan_sample_digits"]
+            )
+            # A table that small is cheap to plan exactly
+            if plan is not None:
+                return plan
+        return self._plan_ranges(base_query, range_count, options["plan_granularity"])
+
+    def _write_metrics(self, path, run_seconds, batches=None):
+        """Write a machine-readable summary of the run as JSON or Prometheus text
+
+        The monitor rewrites it while the run goes on, with batch latency
+        percentiles estimated from the histograms; the final write passes
+        every batch's commit latency for exact ones.
+        """
+        metrics = self._collect_metrics()
+        if batches is None:
+            transaction = metrics.stages["transaction"]
+            p50, p99 = (transaction.quantile(q) for q in (0.5, 0.99))
+            p50, p99 = (None if q is None else q * 1000 for q in (p50, p99))
+            rows, batch_count = metrics.rows, transaction.count
         else:
-            self.stdout.write("Initializing new processing tracking...")
-            for worker_id in range(self.worker_count):
-                cache.delete(f"worker_{worker_id}_last_created_at")
-                cache.delete(f"worker_{worker_id}_processed_count")
+            latencies = sorted(seconds * 1000 for _, seconds in batches)
+            quantiles = (
+                statistics.quantiles(latencies, n=100, method="inclusive")
+                if len(latencies) > 1
+                else latencies * 99
+            )
+            p50 = quantiles[49] if quantiles else None
+            p99 = quantiles[98] if quantiles else None
+            rows = sum(batch_rows for batch_rows, _ in batches)
+            batch_count = len(batches)
+        summary = {
+            "final": batches is not None,
+            "rows": rows,
+            "seconds": run_seconds,
+            "rows_per_second": rows / run_seconds if run_seconds > 0 else 0,
+            "batches": batch_count,
+            "p50_batch_ms": p50,
+            "p99_batch_ms": p99,
+            # This process's pools only; process workers each have their own
+            "connection_pools": pool_stats(),
+            **metrics.summary(),
+        }
+
+        if self.options["metrics_format"] == "json":
+            write_atomically(path, json.dumps(summary, indent=2))
+            return
+        gauges = {
+            name: summary[name] for name in ("rows", "seconds", "rows_per_second")
+        }
+        gauges["batches"] = batch_count
+        gauges["final"] = int(summary["final"])
+        for alias, stats in summary["connection_pools"].items():
+            for key, value in stats.items():
+                if value is not None:
+                    gauges[f'pool_{key}{{alias="{alias}"}}'] = value
+        write_atomically(path, render_prometheus(metrics, gauges))
+
+    def _publish_metrics(self, worker_id, force=False):
+        """Share the worker's metrics through the progress cache, at most once a second
+
+        Process workers have no other way to reach the parent, so thread
+        workers take the same path.
+        """
+        now = time.monotonic()
+        if not force and now - self.metrics_published_at.get(worker_id, 0) < 1.0:
+            return
+        self.metrics_published_at[worker_id] = now
+        self.progress.publish(worker_id, self.metrics[worker_id].to_dict())
+
+    def _collect_metrics(self):
+        """Merge the metrics every worker has published so far"""
+        metrics = RunMetrics()
+        for published in self.progress.snapshots():
+            metrics.merge(RunMetrics.from_dict(published))
+        return metrics
+
+    def _report_write_throughput(self, writer_name, progress):
+        """Print rows per second of pure write time, to compare writer strategies"""
+        rows = sum(counters.get("processed", 0) for counters in progress.values())
+        write_seconds = (
+            sum(counters.get("write_us", 0) for counters in progress.values())
+            / 1_000_000
+        )
+        if write_seconds > 0:
+            rate = rows / write_seconds
+            self.stdout.write(
+                f"Writer {writer_name}: {write_seconds:.2f}s spent writing "
+                f"({rate:.0f} rows/sec per worker)"
+            )
+
+    def _report_pool_waits(self):
+        """Print how long checkouts waited on this process's connection pools"""
+        for alias, stats in pool_stats().items():
+            if not stats["checkouts"]:
+                continue
+            self.stdout.write(
+                f"Connection pool {alias}: {stats['checkouts']} checkouts, "
+                f"wait p50 {stats['p50_wait_ms']:.1f}ms, "
+                f"p99 {stats['p99_wait_ms']:.1f}ms, "
+                f"max {stats['max_wait_ms']:.1f}ms, {stats['timeouts']} timeouts"
+            )
+
+    def _configure(self, options):
+        """Apply the per-run options every worker needs, in this or a pool process"""
+        self.options = options
+        self.writer = get_writer(options["writer"])
+        self.token_generator = get_token_generator(
+            options["token_strategy"], options["token_seed"]
+        )
+        self.prefetch_pages = options["prefetch_pages"]
+        self.rate_limiter = RateLimiter(options["max_rows_per_second"])
+
+    def _create_executor(self, executor_kind, job_id, owner):
+        """Create the worker pool, the range queue it shares and its worker entry point"""
+        if executor_kind == "process":
+            # Spawned children import Django from scratch and open their own
+            # DB connection instead of inheriting the parent's socket
+            context = multiprocessing.get_context("spawn")
+            self.manager = context.Manager()
+            executor = ProcessPoolExecutor(
+                max_workers=self.worker_count,
+                mp_context=context,
+                initializer=setup_django,
+                initargs=(os.environ.get("DJANGO_SETTINGS_MODULE", "core.settings"),),
+            )
+            run_worker = functools.partial(
+                _run_process_worker,
+                job_id=job_id,
+                worker_count=self.worker_count,
+                owner=owner,
+                # Output streams passed through call_command cannot be pickled
+                options={
+                    key: value
+                    for key, value in self.options.items()
+                    if key not in ("stdout", "stderr")
+                },
+            )
+            return executor, self.manager.Queue(), run_worker
+
+        self._check_pool_capacity()
+        executor = ThreadPoolExecutor(
+            max_workers=self.worker_count, thread_name_prefix="worker"
+        )
+        return executor, queue.Queue(), self._run_worker
+
+    def _check_pool_capacity(self):
+        """Fail fast if the worker threads need more connections than the pool has"""
+        capacity = getattr(connections[DEFAULT_DB_ALIAS], "pool_capacity", None)
+        if capacity is None:
+            return
+        # Each worker writes on one connection while its reader scans on
+        # another, unless scans go to a replica; the main thread keeps one
+        needed = self.worker_count * (1 if settings.DATABASE_REPLICAS else 2) + 1
+        if needed > capacity:
+            raise CommandError(
+                f"{self.worker_count} workers need {needed} connections but the "
+                f"pool holds {capacity}; raise POOL_SIZE or MAX_OVERFLOW, or use "
+                "--executor=process"
+            )
+
+
+def _run_process_worker(
+    worker_id, batch_size, range_queue, job_id, worker_count, owner, options
+):
+    """Run one worker inside a pool process; progress reaches the parent via Redis
+
+    owner is the parent's lease owner in --distributed mode, else None.
+    """
+    command = Command()
+    command._configure(options)
+    command.worker_count = worker_count
+    command.progress = ProgressCounters(job_id, worker_count, host=owner)
+    if owner is not None:
+        command.leases = RangeLeases(job_id, options["lease_seconds"], owner=owner)
+    sampler = None
+    if options["sample_stacks"]:
+        sampler = StackSampler(options["sample_interval"])
+        sampler.start()
+    try:
+        return command._run_worker(worker_id, batch_size, range_queue)
+    finally:
+        if command.leases is not None:
+            command.leases.stop()
+        if sampler is not None:
+            sampler.stop()
+            sampler.write(f"{options['sample_stacks']}.{worker_id}")
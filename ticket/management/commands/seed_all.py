@@ -0,0 +1,226 @@
+import multiprocessing
+import os
+import queue
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from faker import Faker
+
+from order.models import Order
+from ticket.bloom import publish_tokens
+from ticket.models import Ticket
+from ticket.tokens import RandomHexTokens
+from user.models import User
+from utils.basemodel import bulk_insert, new_uuid
+from utils.process import setup_django
+from utils.workload import PROFILES
+
+
+def share(total, parts, start, count):
+    """Rows of total that belong to parts[start:start + count], spread evenly"""
+    return total * (start + count) // parts - total * start // parts
+
+
+class Command(BaseCommand):
+    help = "Seed users, orders and tickets together across processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--orders", type=int, default=10000)
+        parser.add_argument("--tickets", type=int, default=1000000)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of processes, each seeding its own slice of users",
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Seed random and Faker for a reproducible dataset"
+        )
+        parser.add_argument(
+            "--profile",
+            choices=list(PROFILES),
+            default="uniform",
+            help="Workload profile shaping domains, fan-out, timestamps and deletions",
+        )
+
+    def handle(self, *args, **options):
+        users = options["users"]
+        processes = max(1, min(options["processes"], users))
+        totals = {
+            "users": users,
+            "orders": options["orders"],
+            "tickets": options["tickets"],
+        }
+        self.stdout.write(
+            f"Creating {users} users, {totals['orders']} orders and "
+            f"{totals['tickets']} tickets with {processes} processes..."
+        )
+
+        # Spawned children set Django up themselves and open their own connection
+        context = multiprocessing.get_context("spawn")
+        with (
+            context.Manager() as manager,
+            ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=context,
+                initializer=setup_django,
+                initargs=(os.environ.get("DJANGO_SETTINGS_MODULE", "core.settings"),),
+            ) as executor,
+        ):
+            progress = manager.Queue()
+            futures = [
+                executor.submit(
+                    _seed_partition,
+                    partition,
+                    {
+                        kind: share(total, processes, partition, 1)
+                        for kind, total in totals.items()
+                    },
+                    options["batch_size"],
+                    options["seed"],
+                    options["profile"],
+                    progress,
+                )
+                for partition in range(processes)
+            ]
+            created = self._report_progress(futures, progress, totals)
+
+            # Surface the first failure, if any partition raised
+            for future in futures:
+                future.result()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully created {created['users']} users, "
+                f"{created['orders']} orders and {created['tickets']} tickets"
+            )
+        )
+
+    def _report_progress(self, futures, progress, totals):
+        """Aggregate the partitions' progress messages until all of them finish"""
+        created = Counter()
+        last_report = 0.0
+        while True:
+            finished = all(future.done() for future in futures)
+            try:
+                kind, rows = progress.get(timeout=0.5)
+                created[kind] += rows
+            except queue.Empty:
+                if finished:
+                    return created
+
+            now = time.monotonic()
+            if now - last_report >= 1.0:
+                last_report = now
+                self.stdout.write(
+                    "Progress: "
+                    + ", ".join(
+                        f"{created[kind]}/{total} {kind}"
+                        for kind, total in totals.items()
+                    )
+                )
+
+
+def _seed_partition(partition, counts, batch_size, seed, profile_name, progress):
+    """Seed one slice of users, then their orders, then those orders' tickets
+
+    Child rows are attached to parent ids generated in this process, so
+    nothing is re-queried, and memory stays bounded by one user batch.
+    """
+    rng = random.Random(None if seed is None else seed + partition)
+    profile = PROFILES[profile_name]
+    now = timezone.now()
+    fake = Faker()
+    if seed is not None:
+        fake.seed_instance(seed + partition)
+
+    # Faker is far slower than the inserts, so values come from small pools
+    first_names = [fake.first_name() for _ in range(1000)]
+    last_names = [fake.last_name() for _ in range(1000)]
+    names = [fake.name() for _ in range(1000)]
+    passwords = [fake.password() for _ in range(100)]
+    tokens = RandomHexTokens(rng)
+
+    users = counts["users"]
+    orders_created = 0
+    for start in range(0, users, batch_size):
+        batch_users = min(batch_size, users - start)
+        user_batch = [
+            User(
+                id=new_uuid(rng),
+                email=f"{rng.getrandbits(64):016x}@{domain}",
+                email_domain=domain,
+                first_name=rng.choice(first_names),
+                last_name=rng.choice(last_names),
+                password=rng.choice(passwords),
+                created_at=created_at,
+                updated_at=created_at,
+                deleted_at=now if deleted else None,
+            )
+            for domain, created_at, deleted in zip(
+                profile.sample_domains(rng, batch_users),
+                profile.sample_created_at(rng, now, batch_users),
+                profile.sample_deleted(rng, batch_users),
+            )
+        ]
+        bulk_insert(User, user_batch)
+        progress.put(("users", batch_users))
+
+        user_cum_weights = profile.user_cum_weights(rng, batch_users)
+        batch_orders = share(counts["orders"], users, start, batch_users)
+        order_batch = [
+            Order(
+                id=new_uuid(rng),
+                user_id=user.id,
+                name=rng.choice(names),
+                created_at=created_at,
+                updated_at=created_at,
+                # Children of a soft-deleted row go with it, as soft_delete() cascades
+                deleted_at=user.deleted_at or (now if deleted else None),
+            )
+            for user, created_at, deleted in zip(
+                rng.choices(user_batch, cum_weights=user_cum_weights, k=batch_orders),
+                profile.sample_created_at(rng, now, batch_orders),
+                profile.sample_deleted(rng, batch_orders),
+            )
+        ]
+        bulk_insert(Order, order_batch, batch_size=batch_size)
+        progress.put(("orders", batch_orders))
+
+        if not order_batch:
+            continue
+        order_cum_weights = profile.order_cum_weights(rng, batch_orders)
+        # Tickets follow the orders, so batches that drew no orders get none
+        batch_tickets = share(
+            counts["tickets"], counts["orders"], orders_created, batch_orders
+        )
+        orders_created += batch_orders
+        for ticket_start in range(0, batch_tickets, batch_size):
+            chunk = min(batch_size, batch_tickets - ticket_start)
+            tickets = [
+                Ticket(
+                    id=new_uuid(rng),
+                    order_id=order.id,
+                    name=rng.choice(names),
+                    token=token,
+                    created_at=created_at,
+                    updated_at=created_at,
+                    deleted_at=order.deleted_at,
+                    ancestors_alive=order.deleted_at is None,
+                )
+                for token, order, created_at in zip(
+                    tokens.generate(range(chunk)),
+                    rng.choices(order_batch, cum_weights=order_cum_weights, k=chunk),
+                    profile.sample_created_at(rng, now, chunk),
+                )
+            ]
+            bulk_insert(Ticket, tickets)
+            # Bulk inserts send no post_save, so publish the live tokens here
+            publish_tokens(t.token for t in tickets if t.deleted_at is None)
+            progress.put(("tickets", chunk))
@@ -1,11 +1,33 @@
-import itertools
+import csv
+import os
 import random
-import uuid
+import tempfile
 from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
 from order.models import Order
+from ticket.bloom import publish_tokens
 from ticket.models import Ticket
+from ticket.tokens import RandomHexTokens
+from utils.basemodel import bulk_insert, new_uuid
+from utils.dbrouter import use_primary
+from utils.workload import PROFILES
 from faker import Faker
 
+# Columns written by the fast loader, in CSV order
+FAST_COLUMNS = (
+    "id",
+    "name",
+    "token",
+    "order_id",
+    "created_at",
+    "updated_at",
+    "deleted_at",
+    "ancestors_alive",
+)
+# MySQL errors when the server has local_infile off, the default since 8.0
+LOCAL_INFILE_DISABLED = (1148, 3948)
+
 
 class Command(BaseCommand):
     help = "Seed ticket data"
@@ -13,39 +35,237 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument("--count", type=int, default=1000000)
         parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--seed", type=int, help="Seed random and Faker for a reproducible dataset"
+        )
+        parser.add_argument(
+            "--loader",
+            choices=["orm", "fast"],
+            default="orm",
+            help="fast writes CSV chunks and ingests them with LOAD DATA LOCAL "
+            "INFILE on MySQL, or raw multi-row inserts on other backends",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=100000,
+            help="Rows per CSV chunk for the fast loader",
+        )
+        parser.add_argument(
+            "--name-pool",
+            type=int,
+            default=10000,
+            help="Number of Faker names precomputed for the fast loader",
+        )
+        parser.add_argument(
+            "--profile",
+            choices=list(PROFILES),
+            default="uniform",
+            help="Workload profile shaping tickets per order and timestamps",
+        )
 
     def handle(self, *args, **options):
         count = options["count"]
+        if options["seed"] is not None:
+            random.seed(options["seed"])
+            Faker.seed(options["seed"])
         batch_size = options["batch_size"]
+        profile = PROFILES[options["profile"]]
         fake = Faker()
 
-        order_count = Order.objects.count()
-        if not order_count:
+        # (order id, when it or its user was soft-deleted): their tickets are
+        # soft-deleted with them, as soft_delete() cascades. Read from the
+        # primary, which replicas may still lag right after seed_orders
+        with use_primary():
+            orders = [
+                (order_id, order_deleted_at or user_deleted_at)
+                for order_id, order_deleted_at, user_deleted_at in (
+                    Order.all_objects.values_list(
+                        "id", "deleted_at", "user__deleted_at"
+                    )
+                )
+            ]
+        if not orders:
             self.stdout.write("No orders found. Please run seed_orders first")
             return
 
-        # Use iterator instead of list to reduce memory usage
-        order_ids_iterator = Order.objects.values_list("id", flat=True).iterator()
+        # Every order is a candidate for every batch; the profile decides how
+        # many tickets each one draws
+        order_cum_weights = profile.order_cum_weights(random, len(orders))
+
+        if options["loader"] == "fast":
+            self._seed_fast(
+                count,
+                options["chunk_size"],
+                options["name_pool"],
+                fake,
+                profile,
+                orders,
+                order_cum_weights,
+            )
+            return
 
         self.stdout.write(f"Creating {count} tickets...")
+        # Keys and tokens come from the seeded random too
+        tokens = RandomHexTokens(random)
 
         # Process in batches of 1000 records
         for i in range(0, count, batch_size):
             batch_count = min(batch_size, count - i)
-            slice_order_ids = list(
-                itertools.islice(order_ids_iterator, min(batch_count, order_count))
-            )  # Get a slice of order IDs as a list
+            created_at = profile.sample_created_at(random, timezone.now(), batch_count)
             tickets = [
                 Ticket(
-                    order_id=random.choice(
-                        slice_order_ids
-                    ),  # Randomly select an order ID from the list
+                    id=new_uuid(random),
+                    order_id=order_id,
                     name=fake.name(),
-                    token=uuid.uuid4().hex,
+                    token=token,
+                    created_at=timestamp,
+                    updated_at=timestamp,
+                    deleted_at=deleted_at,
+                    ancestors_alive=deleted_at is None,
+                )
+                for token, (order_id, deleted_at), timestamp in zip(
+                    tokens.generate(range(batch_count)),
+                    random.choices(
+                        orders, cum_weights=order_cum_weights, k=batch_count
+                    ),
+                    created_at,
                 )
-                for _ in range(batch_count)
             ]
-            Ticket.objects.bulk_create(tickets)
+            bulk_insert(Ticket, tickets)
+            # Bulk inserts send no post_save, so the token filter hears of
+            # the new tokens here
+            publish_tokens(t.token for t in tickets if t.deleted_at is None)
             self.stdout.write(f"Progress: {i + batch_count}/{count} tickets created")
 
         self.stdout.write(self.style.SUCCESS(f"Successfully created {count} tickets"))
+
+    def _seed_fast(
+        self, count, chunk_size, name_pool, fake, profile, orders, order_cum_weights
+    ):
+        """Generate rows without model instances and bulk load them chunk by chunk"""
+        # Faker is far slower than the load itself, so names come from a pool
+        names = [fake.name() for _ in range(name_pool)]
+        order_pk, ticket_pk = Order._meta.pk, Ticket._meta.pk
+        created_at_field = Ticket._meta.get_field("created_at")
+        orders = [
+            (
+                order_pk.get_db_prep_value(order_id, connection),
+                created_at_field.get_db_prep_value(deleted_at, connection),
+            )
+            for order_id, deleted_at in orders
+        ]
+        tokens = RandomHexTokens(random)
+        load = (
+            self._load_data_infile
+            if connection.vendor == "mysql"
+            else self._insert_many
+        )
+
+        self.stdout.write(f"Creating {count} tickets with the fast loader...")
+
+        for i in range(0, count, chunk_size):
+            chunk_count = min(chunk_size, count - i)
+            created_at = [
+                created_at_field.get_db_prep_value(timestamp, connection)
+                for timestamp in profile.sample_created_at(
+                    random, timezone.now(), chunk_count
+                )
+            ]
+            rows = [
+                (
+                    ticket_pk.get_db_prep_value(new_uuid(random), connection),
+                    random.choice(names),
+                    token,
+                    order_id,
+                    ts,
+                    ts,
+                    deleted_at,
+                    int(deleted_at is None),
+                )
+                for token, (order_id, deleted_at), ts in zip(
+                    tokens.generate(range(chunk_count)),
+                    random.choices(
+                        orders, cum_weights=order_cum_weights, k=chunk_count
+                    ),
+                    created_at,
+                )
+            ]
+            try:
+                load(rows)
+            except connection.Database.Error as e:
+                if load != self._load_data_infile:
+                    raise
+                if e.args[0] not in LOCAL_INFILE_DISABLED:
+                    raise
+                self.stderr.write(
+                    "The server has local_infile disabled; falling back to "
+                    "multi-row inserts (start MySQL with --local-infile=1)"
+                )
+                load = self._insert_many
+                load(rows)
+            publish_tokens(
+                row[FAST_COLUMNS.index("token")]
+                for row in rows
+                if row[FAST_COLUMNS.index("deleted_at")] is None
+            )
+            self.stdout.write(f"Progress: {i + chunk_count}/{count} tickets created")
+
+        self.stdout.write(self.style.SUCCESS(f"Successfully created {count} tickets"))
+
+    def _load_data_infile(self, rows):
+        """Write the chunk as CSV and ingest it with LOAD DATA LOCAL INFILE
+
+        LOCAL INFILE has to be enabled when the client connects, so the load
+        runs on a dedicated connection rather than widening the default one.
+        Binary keys travel as hex and are unhexed by the load itself. With
+        ESCAPED BY '' only a bare NULL reads back as NULL.
+        """
+        columns = list(FAST_COLUMNS)
+        rows = (["NULL" if value is None else value for value in row] for row in rows)
+        assignments = []
+        if Ticket._meta.pk.stores_binary(connection):
+            keys = [FAST_COLUMNS.index("id"), FAST_COLUMNS.index("order_id")]
+            rows = (
+                [value.hex() if i in keys else value for i, value in enumerate(row)]
+                for row in rows
+            )
+            for i in keys:
+                assignments.append(f"{columns[i]} = UNHEX(@{columns[i]})")
+                columns[i] = f"@{columns[i]}"
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".csv", newline="", delete=False
+        ) as f:
+            csv.writer(f, lineterminator="\n").writerows(rows)
+        try:
+            params = connection.get_connection_params()
+            params["local_infile"] = True
+            loader = connection.Database.connect(**params)
+            try:
+                with loader.cursor() as cursor:
+                    cursor.execute(
+                        f"LOAD DATA LOCAL INFILE %s INTO TABLE "
+                        f"{connection.ops.quote_name(Ticket._meta.db_table)} "
+                        "CHARACTER SET utf8mb4 "
+                        "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                        "ESCAPED BY '' LINES TERMINATED BY '\\n' "
+                        f"({', '.join(columns)})"
+                        + (f" SET {', '.join(assignments)}" if assignments else ""),
+                        [f.name],
+                    )
+                loader.commit()
+            finally:
+                loader.close()
+        finally:
+            os.unlink(f.name)
+
+    def _insert_many(self, rows):
+        """Without LOAD DATA, or with it disabled: one raw executemany per chunk"""
+        table = connection.ops.quote_name(Ticket._meta.db_table)
+        placeholders = ", ".join(["%s"] * len(FAST_COLUMNS))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} ({', '.join(FAST_COLUMNS)}) "
+                f"VALUES ({placeholders})",
+                rows,
+            )
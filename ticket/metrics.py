@@ -0,0 +1,258 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Upper bounds of the latency buckets, in seconds; the last bucket is +Inf
+SECONDS_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+QUERY_BUCKETS = (1, 2, 3, 4, 5, 10, 20, 50, 100)
+
+# Where a rotation batch spends its time, in the order it passes through
+STAGES = (
+    "scan",  # reader: keyset page query
+    "queue_wait",  # writer: waiting for the reader's next page
+    "build",  # new tokens and Ticket objects
+    "throttle",  # waiting for the shared rate budget
+    "write",  # the writer's statements
+    "checkpoint",  # the range's cursor and count, updated inside the transaction
+    "commit",  # leaving transaction.atomic
+    "transaction",  # write, checkpoint and commit together
+    "sync",  # lookup cache invalidation and token filter publish
+    "pause",  # the governor's pause between batches
+)
+
+
+class Histogram:
+    """Counts per latency bucket and their sum, rendered as a Prometheus histogram"""
+
+    def __init__(self, bounds, counts=None, total=0.0):
+        self.bounds = bounds
+        self.counts = list(counts) if counts else [0] * (len(bounds) + 1)
+        self.total = total
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                break
+        else:
+            i = len(self.bounds)
+        self.counts[i] += 1
+        self.total += value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside its bucket"""
+        count = self.count
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.bounds[i - 1] if i else 0.0
+                if i == len(self.bounds):
+                    return lower
+                return lower + (self.bounds[i] - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-1]
+
+    def to_dict(self):
+        return {"counts": self.counts, "sum": self.total}
+
+    @classmethod
+    def from_dict(cls, bounds, data):
+        return cls(bounds, data["counts"], data["sum"])
+
+
+class RunMetrics:
+    """One worker's rows, stage latencies and queries per batch, safe across its threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rows = 0
+        self.stages = {stage: Histogram(SECONDS_BUCKETS) for stage in STAGES}
+        self.queries = Histogram(QUERY_BUCKETS)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.stages[name].observe(seconds)
+
+    def observe_batch(self, rows, queries):
+        with self.lock:
+            self.rows += rows
+            self.queries.observe(queries)
+
+    def merge(self, other):
+        with self.lock:
+            self.rows += other.rows
+            for name, histogram in other.stages.items():
+                self.stages[name].merge(histogram)
+            self.queries.merge(other.queries)
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "rows": self.rows,
+                "stages": {
+                    name: histogram.to_dict() for name, histogram in self.stages.items()
+                },
+                "queries": self.queries.to_dict(),
+            }
+
+    @classmethod
+    def from_dict(cls, data):
+        metrics = cls()
+        metrics.rows = data["rows"]
+        for name, histogram in data["stages"].items():
+            metrics.stages[name] = Histogram.from_dict(SECONDS_BUCKETS, histogram)
+        metrics.queries = Histogram.from_dict(QUERY_BUCKETS, data["queries"])
+        return metrics
+
+    def summary(self):
+        """Per-stage count, total seconds and p50/p99 in milliseconds, for JSON"""
+
+        def ms(seconds):
+            return None if seconds is None else seconds * 1000
+
+        with self.lock:
+            stages = {
+                name: {
+                    "count": histogram.count,
+                    "seconds": histogram.total,
+                    "p50_ms": ms(histogram.quantile(0.5)),
+                    "p99_ms": ms(histogram.quantile(0.99)),
+                }
+                for name, histogram in self.stages.items()
+            }
+            queries = {
+                "batches": self.queries.count,
+                "mean": self.queries.total / self.queries.count
+                if self.queries.count
+                else None,
+                "p99": self.queries.quantile(0.99),
+            }
+        return {"stages": stages, "queries_per_batch": queries}
+
+
+def render_prometheus(metrics, gauges):
+    """Prometheus text exposition of the histograms and the gauges
+
+    gauges maps a name, optionally with labels as in 'name{alias="default"}',
+    to its value; every name is prefixed with ticket_rotation_.
+    """
+    lines = []
+    typed = set()
+    for name, value in gauges.items():
+        base = name.partition("{")[0]
+        if base not in typed:
+            typed.add(base)
+            lines.append(f"# TYPE ticket_rotation_{base} gauge")
+        lines.append(f"ticket_rotation_{name} {value}")
+
+    def histogram_lines(name, labels, histogram):
+        cumulative = 0
+        for bound, bucket_count in zip((*histogram.bounds, "+Inf"), histogram.counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+        labels = f"{{{labels.rstrip(',')}}}" if labels else ""
+        lines.append(f"{name}_sum{labels} {histogram.total}")
+        lines.append(f"{name}_count{labels} {cumulative}")
+
+    with metrics.lock:
+        lines.append("# TYPE ticket_rotation_stage_seconds histogram")
+        for stage, histogram in metrics.stages.items():
+            histogram_lines(
+                "ticket_rotation_stage_seconds", f'stage="{stage}",', histogram
+            )
+        lines.append("# TYPE ticket_rotation_batch_queries histogram")
+        histogram_lines("ticket_rotation_batch_queries", "", metrics.queries)
+    return "\n".join(lines) + "\n"
+
+
+def write_atomically(path, content):
+    """Replace path in one rename, so a reader or scraper never sees half a file"""
+    partial = f"{path}.tmp"
+    with open(partial, "w") as f:
+        f.write(content)
+    os.replace(partial, path)
+
+
+class StackSampler:
+    """Sample every thread's stack at a fixed interval, for flame graphs
+
+    Counts collapsed stacks, one "thread;outer;...;inner count" line each,
+    the input of flamegraph.pl and speedscope. A sample costs one
+    sys._current_frames() call, so it can stay on for a whole rotation.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def write(self, path):
+        with open(path, "w") as f:
+            f.writelines(
+                f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+            )
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-17 07:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("order", "0001_initial"),
+        ("ticket", "0002_ticket_ticket_created_807d9e_idx"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="ticket",
+            name="ticket_created_807d9e_idx",
+        ),
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(
+                fields=["created_at", "id", "order_id"],
+                name="ticket_created_c2a0c5_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-17 07:21
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ticket", "0003_remove_ticket_ticket_created_807d9e_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="ticket",
+            name="ticket_token_7634ce_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="ticket",
+            name="ticket_order_i_5e884d_idx",
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-17 07:24
+
+import utils.basemodel
+from django.conf import settings
+from django.db import migrations
+
+
+def to_binary(apps, schema_editor):
+    if settings.BINARY_UUID_KEYS:
+        utils.basemodel.convert_uuid_keys(schema_editor, apps.get_models(), True)
+
+
+def to_char(apps, schema_editor):
+    if settings.BINARY_UUID_KEYS:
+        utils.basemodel.convert_uuid_keys(schema_editor, apps.get_models(), False)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("order", "0003_alter_order_id"),
+        ("ticket", "0004_remove_ticket_ticket_token_7634ce_idx_and_more"),
+        ("user", "0004_alter_user_id"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="ticket",
+                    name="id",
+                    field=utils.basemodel.BinaryUUIDField(
+                        default=utils.basemodel.new_uuid,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+            ],
+        ),
+        # The key columns only change when binary storage is switched on;
+        # otherwise BinaryUUIDField keeps UUIDField's char(32) columns
+        migrations.RunPython(to_binary, to_char),
+    ]
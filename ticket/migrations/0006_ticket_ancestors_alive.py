@@ -0,0 +1,26 @@
+# Generated by Django 5.1.3 on 2026-10-17 07:27
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def backfill_ancestors_alive(apps, schema_editor):
+    Ticket = apps.get_model("ticket", "Ticket")
+    Ticket._base_manager.filter(
+        Q(order__deleted_at__isnull=False) | Q(order__user__deleted_at__isnull=False)
+    ).update(ancestors_alive=False)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ticket", "0005_alter_ticket_id"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ticket",
+            name="ancestors_alive",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(backfill_ancestors_alive, migrations.RunPython.noop),
+    ]
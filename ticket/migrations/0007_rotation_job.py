@@ -0,0 +1,73 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:48
+
+import django.db.models.deletion
+import utils.basemodel
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ticket", "0006_ticket_ancestors_alive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RotationJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("total_tickets", models.BigIntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("finished_at", models.DateTimeField(null=True)),
+            ],
+            options={
+                "db_table": "token_rotation_job",
+            },
+        ),
+        migrations.CreateModel(
+            name="RotationRange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("number", models.PositiveIntegerField()),
+                ("start_created_at", models.DateTimeField(null=True)),
+                ("start_id", utils.basemodel.BinaryUUIDField(null=True)),
+                ("end_created_at", models.DateTimeField(null=True)),
+                ("end_id", utils.basemodel.BinaryUUIDField(null=True)),
+                ("cursor_created_at", models.DateTimeField(null=True)),
+                ("cursor_id", utils.basemodel.BinaryUUIDField(null=True)),
+                ("processed", models.BigIntegerField(default=0)),
+                ("completed_at", models.DateTimeField(null=True)),
+                (
+                    "job",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ranges",
+                        to="ticket.rotationjob",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "token_rotation_range",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("job", "number"), name="token_rotation_range_job_number"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.15 on 2026-10-17 07:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("ticket", "0007_rotation_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rotationrange",
+            name="lease_token",
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.15 on 2026-10-17 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("order", "0003_alter_order_id"),
+        ("ticket", "0008_rotationrange_lease_token"),
+    ]
+
+    # The new index is built before the old one goes, so the scan always has one
+    operations = [
+        migrations.AddIndex(
+            model_name="ticket",
+            index=models.Index(
+                fields=[
+                    "created_at",
+                    "id",
+                    "order_id",
+                    "ancestors_alive",
+                    "deleted_at",
+                    "token",
+                ],
+                name="ticket_created_313ca9_idx",
+            ),
+        ),
+        migrations.RemoveIndex(
+            model_name="ticket",
+            name="ticket_created_c2a0c5_idx",
+        ),
+    ]
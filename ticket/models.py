@@ -1,7 +1,7 @@
 from django.db import models
 
 from order.models import Order
-from utils.basemodel import BaseModel
+from utils.basemodel import BaseModel, BinaryUUIDField
 
 
 class Ticket(BaseModel):
@@ -13,11 +13,94 @@ class Ticket(BaseModel):
         related_name="tickets",
         db_index=True,
     )
+    # Denormalised: False once the order or its user is soft-deleted, so hot
+    # filters need no join to see it
+    ancestors_alive = models.BooleanField(default=True)
+
+    ancestors_alive_field = "ancestors_alive"
 
     class Meta:
         db_table = "ticket"
+        # token (unique) and order (FK) are already indexed by their fields
         indexes = [
-            models.Index(fields=["token"]),
-            models.Index(fields=["order_id"]),
-            models.Index(fields=["created_at"]),
+            # Serves the (created_at, id) keyset scan in regenerate_tokens and
+            # covers the rest of its page read: the order_id for the
+            # eligibility join, the liveness filters and the old token
+            models.Index(
+                fields=[
+                    "created_at",
+                    "id",
+                    "order_id",
+                    "ancestors_alive",
+                    "deleted_at",
+                    "token",
+                ]
+            ),
         ]
+
+
+class RotationJob(models.Model):
+    """One regenerate_tokens run and its plan; --resume continues an unfinished one"""
+
+    total_tickets = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = "token_rotation_job"
+
+
+class RotationRange(models.Model):
+    """A planned [start, end) slice of a job's (created_at, id) keyset and its checkpoint
+
+    The cursor and processed count are updated in the same transaction as
+    each page of tickets, so they are exactly as far as the committed
+    tokens. Ranges, not workers, carry the progress, so a job can resume
+    with any number of workers.
+    """
+
+    job = models.ForeignKey(
+        RotationJob, on_delete=models.CASCADE, related_name="ranges"
+    )
+    # Position in the plan, starting at 0
+    number = models.PositiveIntegerField()
+    # A missing bound is open; a bound with no id sits before every ticket
+    # at its created_at
+    start_created_at = models.DateTimeField(null=True)
+    start_id = BinaryUUIDField(null=True)
+    end_created_at = models.DateTimeField(null=True)
+    end_id = BinaryUUIDField(null=True)
+    # Key of the last ticket committed in this range
+    cursor_created_at = models.DateTimeField(null=True)
+    cursor_id = BinaryUUIDField(null=True)
+    processed = models.BigIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True)
+    # Fencing token of the latest lease in --distributed mode; checkpoints
+    # of an earlier holder no longer match
+    lease_token = models.BigIntegerField(null=True)
+
+    class Meta:
+        db_table = "token_rotation_range"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["job", "number"], name="token_rotation_range_job_number"
+            ),
+        ]
+
+    @property
+    def start(self):
+        if self.start_created_at is None:
+            return None
+        return self.start_created_at, self.start_id
+
+    @property
+    def end(self):
+        if self.end_created_at is None:
+            return None
+        return self.end_created_at, self.end_id
+
+    @property
+    def cursor(self):
+        if self.cursor_created_at is None:
+            return None
+        return self.cursor_created_at, self.cursor_id
@@ -0,0 +1,105 @@
+from django.core.cache import caches
+from django_redis import get_redis_connection
+from redis.exceptions import RedisError
+
+# Counters and snapshots outlive the run so a monitor can still read them
+PROGRESS_TTL = 86400
+
+
+class ProgressCounters:
+    """Per-worker progress counters of one rotation job, in one Redis hash
+
+    Fields are "<worker id>:<counter>", bumped with HINCRBY, so worker
+    threads and processes add to them without a lock, and the monitor reads
+    every worker with one HGETALL. The key is namespaced by job, and by host
+    when several hosts share a job, so each keeps its own counts. Metrics
+    snapshots sit next to it in the uncompressed progress cache.
+
+    The counts only drive the progress display and reports; a Redis error
+    loses some of them, never work, so it is swallowed. Without a
+    django_redis cache they fall back to the cache API, one key per field.
+    """
+
+    def __init__(self, job_id, worker_count, host=None, alias="progress"):
+        self.cache = caches[alias]
+        self.prefix = f"token_rotation:{job_id}"
+        if host is not None:
+            self.prefix = f"{self.prefix}:{host}"
+        self.key = self.cache.make_key(f"{self.prefix}:progress")
+        self.worker_count = worker_count
+        self.last_read = {}
+        try:
+            self.client = get_redis_connection(alias)
+        except NotImplementedError:
+            self.client = None
+
+    def add(self, worker_id, **counters):
+        """Add integer amounts to the worker's counters in one round trip"""
+        try:
+            if self.client is None:
+                for name, amount in counters.items():
+                    key = f"{self.prefix}:{worker_id}:{name}"
+                    self.cache.add(key, 0, PROGRESS_TTL)
+                    self.cache.incr(key, amount)
+                return
+            pipe = self.client.pipeline(transaction=False)
+            for name, amount in counters.items():
+                pipe.hincrby(self.key, f"{worker_id}:{name}", amount)
+            pipe.expire(self.key, PROGRESS_TTL)
+            pipe.execute()
+        except RedisError:
+            pass
+
+    def read(self):
+        """{worker id: {counter: value}}; the last good read if Redis fails"""
+        try:
+            if self.client is None:
+                fields = self.cache.get_many(
+                    [
+                        f"{self.prefix}:{worker_id}:{name}"
+                        for worker_id in range(self.worker_count)
+                        for name in ("processed", "write_us")
+                    ]
+                )
+                fields = {
+                    key.removeprefix(f"{self.prefix}:"): value
+                    for key, value in fields.items()
+                }
+            else:
+                fields = self.client.hgetall(self.key)
+        except RedisError:
+            return self.last_read
+        counts = {worker_id: {} for worker_id in range(self.worker_count)}
+        for field, value in fields.items():
+            if isinstance(field, bytes):
+                field = field.decode()
+            worker_id, _, name = field.partition(":")
+            counts.setdefault(int(worker_id), {})[name] = int(value)
+        self.last_read = counts
+        return counts
+
+    def publish(self, worker_id, snapshot):
+        self.cache.set(f"{self.prefix}:{worker_id}:metrics", snapshot, PROGRESS_TTL)
+
+    def snapshots(self):
+        """Every worker's published metrics snapshot, in one MGET"""
+        keys = [
+            f"{self.prefix}:{worker_id}:metrics"
+            for worker_id in range(self.worker_count)
+        ]
+        return list(self.cache.get_many(keys).values())
+
+    def reset(self):
+        """Forget the counts and snapshots of an earlier run of the job"""
+        self.cache.delete_many(
+            [
+                f"{self.prefix}:{worker_id}:{name}"
+                for worker_id in range(self.worker_count)
+                for name in ("processed", "write_us", "metrics")
+            ]
+        )
+        if self.client is not None:
+            try:
+                self.client.delete(self.key)
+            except RedisError:
+                pass
@@ -0,0 +1,31 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from ticket.bloom import publish_tokens
+from ticket.lookup import invalidate_tokens
+from ticket.models import Ticket
+from utils.basemodel import post_soft_delete
+from utils.dbrouter import use_primary
+
+
+@receiver(post_save, sender=Ticket)
+def publish_ticket_token(sender, instance, **kwargs):
+    # The token may be new; bulk writes publish their own tokens
+    if instance.deleted_at is None:
+        publish_tokens([instance.token])
+
+
+@receiver(post_delete, sender=Ticket)
+def invalidate_ticket_token(sender, instance, **kwargs):
+    invalidate_tokens([instance.token])
+
+
+# Soft deletes of orders and users cascade to their tickets, so every
+# soft-deleted ticket arrives here in batches
+@receiver(post_soft_delete, sender=Ticket)
+def invalidate_soft_deleted_tokens(sender, pks, **kwargs):
+    # Fresh rows may not have reached the replicas yet
+    with use_primary():
+        invalidate_tokens(
+            Ticket.all_objects.filter(pk__in=pks).values_list("token", flat=True)
+        )
@@ -1 +1,683 @@
-# Create your tests here.
+import contextlib
+import io
+import os
+import tempfile
+import time
+import uuid
+from collections import Counter
+from datetime import timedelta
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, router
+from django.db.models import Max
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from order.models import Order
+from ticket.bloom import (
+    SEQUENCE_KEY,
+    SNAPSHOT_KEY,
+    VERSION_KEY,
+    BloomFilter,
+    TokenFilter,
+    delta_key,
+    publish_token_filter,
+    publish_tokens,
+)
+from ticket.leases import LeaseLost, LocalLeaseStore, RangeLeases
+from ticket.management.commands.regenerate_tokens import Command
+from ticket.models import RotationJob, RotationRange, Ticket
+from ticket.writers import WRITERS
+from user.models import User
+from utils import dbrouter
+from utils.basemodel import bulk_insert, post_soft_delete
+from utils.dbrouter import STICKY_COOKIE, ReplicaStickinessMiddleware, use_primary
+from utils.mysql_pool import base as mysql_pool
+
+
+def create_order(domain="example.com"):
+    user = User.objects.create(
+        email=f"{uuid.uuid4().hex}@{domain}", first_name="Ada", last_name="Lovelace"
+    )
+    return Order.objects.create(user=user, name="Order")
+
+
+def create_tickets(count, order=None, created_at=None):
+    """count tickets of one order, all created in the same instant"""
+    order = order or create_order()
+    created_at = created_at or timezone.now()
+    return bulk_insert(
+        Ticket,
+        [
+            Ticket(
+                order=order,
+                name="Ticket",
+                token=uuid.uuid4().hex,
+                created_at=created_at,
+                updated_at=created_at,
+            )
+            for _ in range(count)
+        ],
+    )
+
+
+def tokens():
+    return dict(Ticket.all_objects.values_list("pk", "token"))
+
+
+class RangeLeasesTests(SimpleTestCase):
+    """Two hosts sharing one job through the same in-process lease store"""
+
+    def setUp(self):
+        store = LocalLeaseStore()
+        self.host_a = RangeLeases(1, ttl=0.2, owner="a", store=store)
+        self.host_b = RangeLeases(1, ttl=0.2, owner="b", store=store)
+
+    def tearDown(self):
+        self.host_a.stop()
+        self.host_b.stop()
+
+    def test_claims_are_exclusive(self):
+        self.assertEqual(self.host_a.claim(1), 1)
+        self.assertIsNone(self.host_b.claim(1))
+        # Fencing tokens come from one counter per job
+        self.assertEqual(self.host_b.claim(2), 2)
+
+        self.host_a.release(1)
+        self.assertEqual(self.host_b.claim(1), 3)
+
+    def test_heartbeat_keeps_lease(self):
+        self.host_a.claim(1)
+        time.sleep(0.5)
+        self.assertIsNone(self.host_b.claim(1))
+        self.assertEqual(self.host_a.token(1), 1)
+
+    def test_expired_lease_is_reclaimed(self):
+        self.host_a.claim(1)
+        # The host dies: nothing renews its lease any more
+        self.host_a.stop()
+        time.sleep(0.3)
+
+        self.assertEqual(self.host_b.claim(1), 2)
+        self.assertEqual(self.host_b.token(1), 2)
+
+    def test_stale_holder_loses_lease(self):
+        self.host_a.claim(1)
+        self.host_a.stop()
+        time.sleep(0.3)
+
+        with self.assertRaises(LeaseLost):
+            self.host_a.token(1)
+
+
+class RangeFencingTests(TestCase):
+    def setUp(self):
+        self.store = LocalLeaseStore()
+        job = RotationJob.objects.create(total_tickets=0)
+        self.range = RotationRange.objects.create(job=job, number=0)
+        self.host_a = self._host(job, "a")
+        self.host_b = self._host(job, "b")
+
+    def tearDown(self):
+        self.host_a.leases.stop()
+        self.host_b.leases.stop()
+
+    def _host(self, job, owner):
+        host = Command()
+        host.leases = RangeLeases(job.pk, owner=owner, store=self.store)
+        return host
+
+    def test_reclaim_fences_out_stale_checkpoint(self):
+        self.assertEqual(self.host_a._claim_range()[0], self.range.pk)
+        # Host a stalls until its lease expires, before its heartbeat notices
+        key = self.host_a.leases._key(self.range.pk)
+        self.store.leases[key] = (self.store.leases[key][0], 0)
+
+        self.assertEqual(self.host_b._claim_range()[0], self.range.pk)
+        self.range.refresh_from_db()
+        self.assertEqual(self.range.lease_token, 2)
+
+        self.assertEqual(
+            self.host_a._range_checkpoint(self.range.pk).update(processed=10), 0
+        )
+        self.assertEqual(
+            self.host_b._range_checkpoint(self.range.pk).update(processed=20), 1
+        )
+        self.range.refresh_from_db()
+        self.assertEqual(self.range.processed, 20)
+
+
+def reset_pin(test):
+    """Start the test with reads unpinned, as a fresh request would"""
+    token = dbrouter._pinned_until.set(0.0)
+    test.addCleanup(dbrouter._pinned_until.reset, token)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_0"], REPLICA_STICKY_SECONDS=5.0)
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        reset_pin(self)
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(router.db_for_read(Ticket), "replica_0")
+
+    def test_writes_go_to_primary_and_pin_reads(self):
+        self.assertEqual(router.db_for_write(Ticket), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_read(Ticket), DEFAULT_DB_ALIAS)
+
+    @override_settings(REPLICA_STICKY_SECONDS=0.1)
+    def test_pin_expires(self):
+        router.db_for_write(Ticket)
+        time.sleep(0.2)
+        self.assertEqual(router.db_for_read(Ticket), "replica_0")
+
+    def test_use_primary(self):
+        with use_primary():
+            self.assertEqual(router.db_for_read(Ticket), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_read(Ticket), "replica_0")
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        self.assertEqual(router.db_for_write(Ticket), DEFAULT_DB_ALIAS)
+        self.assertEqual(dbrouter._pinned_until.get(), 0.0)
+        self.assertEqual(router.db_for_read(Ticket), DEFAULT_DB_ALIAS)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_0"], REPLICA_STICKY_SECONDS=5.0)
+class ReplicaStickinessMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        reset_pin(self)
+        self.factory = RequestFactory()
+
+    def _request(self, view, cookie=None):
+        """The response and the database the view read from"""
+        reads = []
+
+        def get_response(request):
+            view()
+            reads.append(router.db_for_read(Ticket))
+            return HttpResponse()
+
+        request = self.factory.get("/")
+        if cookie is not None:
+            request.COOKIES[STICKY_COOKIE] = cookie
+        return ReplicaStickinessMiddleware(get_response)(request), reads[0]
+
+    def test_write_sets_cookie(self):
+        response, read = self._request(lambda: router.db_for_write(Ticket))
+
+        self.assertEqual(read, DEFAULT_DB_ALIAS)
+        cookie = response.cookies[STICKY_COOKIE]
+        self.assertAlmostEqual(float(cookie.value), time.time() + 5.0, delta=1.0)
+        self.assertEqual(cookie["max-age"], 5.0)
+        # The pin ends with the request
+        self.assertEqual(router.db_for_read(Ticket), "replica_0")
+
+    def test_cookie_pins_next_request(self):
+        response, read = self._request(lambda: None, f"{time.time() + 5.0:.3f}")
+
+        self.assertEqual(read, DEFAULT_DB_ALIAS)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_expired_cookie(self):
+        response, read = self._request(lambda: None, f"{time.time() - 1.0:.3f}")
+
+        self.assertEqual(read, "replica_0")
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+    def test_malformed_cookie(self):
+        _, read = self._request(lambda: None, "soon")
+
+        self.assertEqual(read, "replica_0")
+
+
+@skipUnless(settings.DATABASE_REPLICAS, "no read replica configured")
+class ReplicaReadTests(TransactionTestCase):
+    """Reads through a replica alias; tests mirror it onto default"""
+
+    databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        reset_pin(self)
+
+    def test_read_your_writes(self):
+        job = RotationJob.objects.create(total_tickets=1)
+        # The write pins reads to the primary
+        self.assertEqual(RotationJob.objects.get(pk=job.pk)._state.db, DEFAULT_DB_ALIAS)
+
+        dbrouter._pinned_until.set(0.0)
+        read = RotationJob.objects.get(pk=job.pk)
+        self.assertIn(read._state.db, settings.DATABASE_REPLICAS)
+
+
+class FakeConnection:
+    """Enough of a DB-API connection for ConnectionPool"""
+
+    def __init__(self, params=None):
+        self.params = params
+        self.open = True
+        self.autocommit = True
+        self.rollbacks = 0
+
+    def ping(self, reconnect):
+        if not self.open:
+            raise OSError("closed")
+
+    def get_autocommit(self):
+        return self.autocommit
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.open = False
+
+
+class PoolError(Exception):
+    pass
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(mysql_pool._pools, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _pool(self, **options):
+        return mysql_pool.ConnectionPool(FakeConnection, PoolError, **options)
+
+    def test_checkin_reuses_connection(self):
+        pool = self._pool(size=1)
+        connection = pool.checkout()
+        connection.autocommit = False
+        pool.checkin(connection)
+
+        self.assertIs(pool.checkout(), connection)
+        self.assertEqual(connection.rollbacks, 1)
+        self.assertEqual(pool.stats()["opened"], 1)
+
+    def test_overflow_is_closed_on_checkin(self):
+        pool = self._pool(size=1, max_overflow=1)
+        first, second = pool.checkout(), pool.checkout()
+        pool.checkin(first)
+        pool.checkin(second)
+
+        self.assertTrue(first.open)
+        self.assertFalse(second.open)
+        self.assertEqual((pool.open, len(pool.idle)), (1, 1))
+
+    def test_unusable_connection_is_replaced(self):
+        pool = self._pool(size=1)
+        connection = pool.checkout()
+        pool.checkin(connection, reusable=False)
+
+        self.assertFalse(connection.open)
+        self.assertIsNot(pool.checkout(), connection)
+
+    def test_checkout_times_out_when_exhausted(self):
+        pool = self._pool(size=1, max_overflow=0, timeout=0.05)
+        pool.checkout()
+
+        with self.assertRaises(PoolError):
+            pool.checkout()
+        self.assertEqual(pool.stats()["timeouts"], 1)
+
+    def test_get_pool_reused_for_same_settings(self):
+        first = mysql_pool.get_pool(
+            "default", {"db": "a"}, {}, FakeConnection, PoolError
+        )
+        again = mysql_pool.get_pool(
+            "default", {"db": "a"}, {}, FakeConnection, PoolError
+        )
+
+        self.assertIs(again, first)
+        self.assertEqual(first.checkout().params, {"db": "a"})
+
+    def test_get_pool_rebuilt_when_settings_change(self):
+        old = mysql_pool.get_pool("default", {"db": "a"}, {}, FakeConnection, PoolError)
+        idle, borrowed = old.checkout(), old.checkout()
+        old.checkin(idle)
+
+        pool = mysql_pool.get_pool(
+            "default", {"db": "b"}, {}, FakeConnection, PoolError
+        )
+        self.assertIsNot(pool, old)
+        self.assertEqual(pool.checkout().params, {"db": "b"})
+        self.assertFalse(idle.open)
+        # Still usable until it comes back, then closed rather than kept
+        self.assertTrue(borrowed.open)
+        old.checkin(borrowed)
+        self.assertFalse(borrowed.open)
+
+        resized = mysql_pool.get_pool(
+            "default", {"db": "b"}, {"POOL_SIZE": 2}, FakeConnection, PoolError
+        )
+        self.assertIsNot(resized, pool)
+        self.assertEqual(resized.size, 2)
+
+    def test_forked_child_gets_own_pool(self):
+        parent = mysql_pool.get_pool("default", {}, {}, FakeConnection, PoolError)
+        connection = parent.checkout()
+        parent.checkin(connection)
+
+        with mock.patch.object(mysql_pool.os, "getpid", return_value=os.getpid() + 1):
+            child = mysql_pool.get_pool("default", {}, {}, FakeConnection, PoolError)
+            self.assertIsNot(child, parent)
+            self.assertIsNot(child.checkout(), connection)
+            self.assertEqual(mysql_pool.pool_stats()["default"]["checkouts"], 1)
+        # The parent's pool and its connection are left alone
+        self.assertTrue(connection.open)
+        self.assertIs(
+            mysql_pool.get_pool("default", {}, {}, FakeConnection, PoolError), parent
+        )
+
+
+class RegenerateTokensTests(TransactionTestCase):
+    def _run(self, *args):
+        out = io.StringIO()
+        # The progress line goes to sys.stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            call_command(
+                "regenerate_tokens",
+                "--target-commit-ms=0",
+                *args,
+                stdout=out,
+                stderr=io.StringIO(),
+            )
+        return out.getvalue()
+
+    def test_sampled_plan_of_small_table(self):
+        # Far fewer rows than 16**3, so the id-suffix sample is likely empty
+        create_tickets(300)
+        before = tokens()
+
+        output = self._run("--workers=2", "--plan-sample-digits=3")
+
+        self.assertNotIn("No tickets to process", output)
+        after = tokens()
+        self.assertEqual(after.keys(), before.keys())
+        self.assertTrue(all(after[pk] != token for pk, token in before.items()))
+
+
+class BloomFilterTests(SimpleTestCase):
+    def setUp(self):
+        self.bloom = BloomFilter.for_capacity(1000, 0.001)
+        self.tokens = [uuid.uuid4().hex for _ in range(1000)]
+        self.bloom.update(self.tokens)
+        self.bloom.sequence = 7
+
+    def assert_same(self, copy):
+        self.assertEqual(copy.version, self.bloom.version)
+        self.assertEqual(copy.sequence, 7)
+        self.assertEqual(copy.count, 1000)
+        self.assertEqual(copy.bits, self.bloom.bits)
+        self.assertTrue(all(token in copy for token in self.tokens))
+
+    def test_no_false_negatives(self):
+        self.assertTrue(all(token in self.bloom for token in self.tokens))
+
+    def test_bytes_round_trip(self):
+        self.assert_same(BloomFilter.from_bytes(self.bloom.to_bytes()))
+
+    def test_file_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "tokens.bloom")
+            self.bloom.save(path)
+            self.assert_same(BloomFilter.load(path))
+
+    def test_rejects_other_bytes(self):
+        with self.assertRaises(ValueError):
+            BloomFilter.from_bytes(b"NOPE" + self.bloom.to_bytes()[4:])
+
+
+@override_settings(TOKEN_FILTER_REFRESH_SECONDS=0, TOKEN_FILTER_PATH=None)
+class TokenFilterTests(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(self._forget)
+        self._forget()
+        self.filter = TokenFilter()
+
+    def _forget(self):
+        sequence = cache.get(SEQUENCE_KEY, 0)
+        cache.delete_many(
+            [SNAPSHOT_KEY, VERSION_KEY, SEQUENCE_KEY]
+            + [delta_key(n) for n in range(1, sequence + 1)]
+        )
+
+    def _publish(self, *tokens, sequence=None):
+        bloom = BloomFilter.for_capacity(100, 1e-9)
+        bloom.update(tokens)
+        bloom.sequence = cache.get(SEQUENCE_KEY, 0) if sequence is None else sequence
+        publish_token_filter(bloom)
+
+    def test_unpublished_filter_rejects_nothing(self):
+        self.assertTrue(self.filter.might_contain("unknown"))
+        self.assertEqual(self.filter.state, (None, False))
+
+    def test_snapshot_and_deltas(self):
+        self._publish("a")
+        publish_tokens(["b"])
+
+        self.assertTrue(self.filter.might_contain("a"))
+        self.assertTrue(self.filter.might_contain("b"))
+        self.assertFalse(self.filter.might_contain("unknown"))
+
+    def test_missing_delta_rejects_nothing(self):
+        self._publish("a")
+        publish_tokens(["b"])
+        cache.delete(delta_key(cache.get(SEQUENCE_KEY)))
+
+        self.assertTrue(self.filter.might_contain("unknown"))
+
+    def test_withdrawn_filter_rejects_nothing(self):
+        self._publish("a")
+        self.assertFalse(self.filter.might_contain("unknown"))
+        cache.delete(VERSION_KEY)
+
+        self.assertTrue(self.filter.might_contain("unknown"))
+
+    def test_new_snapshot_is_caught_up_before_use(self):
+        self._publish("a")
+        publish_tokens(["b"])
+        self.assertTrue(self.filter.might_contain("b"))
+        # A rebuild that started before "b" was issued
+        self._publish("a", sequence=0)
+
+        # What a concurrent reader sees while the new snapshot's deltas load
+        seen = []
+        get_many = cache.get_many
+
+        def read_deltas(keys):
+            if delta_key(1) in keys:
+                seen.append(self.filter.state)
+            return get_many(keys)
+
+        with mock.patch.object(cache, "get_many", read_deltas):
+            self.assertTrue(self.filter.might_contain("b"))
+
+        [(bloom, synced)] = seen
+        self.assertTrue(not synced or "b" in bloom)
+
+
+class TokenWriterTests(TestCase):
+    def test_deleted_ticket_is_not_written_back(self):
+        for name, writer in WRITERS.items():
+            with self.subTest(writer=name):
+                tickets = create_tickets(3)
+                updates = [
+                    Ticket(
+                        id=t.id,
+                        order_id=t.order_id,
+                        token=uuid.uuid4().hex,
+                        updated_at=timezone.now(),
+                    )
+                    for t in tickets
+                ]
+                # Hard-deleted between the page read and the write
+                Ticket.all_objects.filter(pk=tickets[0].pk).delete()
+
+                writer().write(updates)
+
+                self.assertFalse(Ticket.all_objects.filter(pk=tickets[0].pk).exists())
+                self.assertEqual(
+                    dict(
+                        Ticket.all_objects.filter(
+                            pk__in=[t.pk for t in tickets]
+                        ).values_list("pk", "token")
+                    ),
+                    {t.pk: t.token for t in updates[1:]},
+                )
+
+
+@override_settings(TOKEN_FILTER_REFRESH_SECONDS=0)
+class SoftDeleteCascadeTests(TestCase):
+    def setUp(self):
+        self.orders = [create_order()]
+        self.user = self.orders[0].user
+        self.orders.append(Order.objects.create(user=self.user, name="Order"))
+        self.tickets = [create_tickets(3, order) for order in self.orders]
+
+    def test_one_select_and_update_per_level(self):
+        with CaptureQueriesContext(connection) as queries:
+            count = User.objects.filter(pk=self.user.pk).soft_delete()
+
+        self.assertEqual(count, 1 + 2 + 6)
+        statements = [query["sql"].split() for query in queries]
+        self.assertEqual(
+            Counter(sql[1].strip('"`') for sql in statements if sql[0] == "UPDATE"),
+            {"user": 1, "order": 1, "ticket": 1},
+        )
+        self.assertEqual(sum(sql[0] == "SELECT" for sql in statements), 3)
+
+    def test_signals_per_batch_after_commit(self):
+        received = []
+
+        def receiver(sender, pks, **kwargs):
+            received.append((sender, len(pks)))
+
+        post_soft_delete.connect(receiver)
+        self.addCleanup(post_soft_delete.disconnect, receiver)
+        with self.captureOnCommitCallbacks(execute=True):
+            Order.objects.filter(user=self.user).soft_delete(batch_size=2)
+            self.assertEqual(received, [])
+
+        # Both orders in one batch, then their six tickets in three
+        self.assertEqual(received, [(Order, 2), (Ticket, 2), (Ticket, 2), (Ticket, 2)])
+
+    def test_deleted_order_tickets_stop_resolving(self):
+        token = self.tickets[0][0].token
+        url = f"/tickets/tokens/{token}/"
+        # Also caches the payload, which the delete has to invalidate
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.orders[0].delete()
+
+        alive = dict(
+            Ticket.all_objects.filter(order__user=self.user)
+            .values_list("order_id")
+            .annotate(alive=Max("ancestors_alive"))
+        )
+        self.assertEqual(alive, {self.orders[0].pk: False, self.orders[1].pk: True})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class BurstMixin:
+    """300 tickets sharing a timestamp, between 20 a second apart on each side"""
+
+    def setUp(self):
+        self.command = Command()
+        order = create_order()
+        burst = timezone.now().replace(microsecond=0)
+        create_tickets(300, order, burst)
+        for seconds in range(1, 21):
+            create_tickets(1, order, burst - timedelta(seconds=seconds))
+            create_tickets(1, order, burst + timedelta(seconds=seconds))
+        self.query = self.command._get_base_query()
+        self.expected = list(
+            self.query.order_by("created_at", "id").values_list("id", flat=True)
+        )
+
+    def scan(self, query, cursor=None, page_size=7):
+        """Every id the keyset pages return after cursor, in order"""
+        ids = []
+        while True:
+            page = self.command._fetch_page(query, cursor, page_size)
+            ids += [ticket_id for ticket_id, *_ in page]
+            if len(page) < page_size:
+                return ids
+            last_id, last_created_at, _, _ = page[-1]
+            cursor = (last_created_at, last_id)
+
+    def checkpoint(self, ticket_id):
+        return Ticket.objects.get(pk=ticket_id).created_at, ticket_id
+
+
+class KeysetScanTests(BurstMixin, TestCase):
+    """Paging by (created_at, id) through a burst of rows sharing a timestamp"""
+
+    def test_pages_skip_and_repeat_nothing(self):
+        for page_size in (1, 7, 100, 1000):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(
+                    self.scan(self.query, page_size=page_size), self.expected
+                )
+
+    def test_resume_from_checkpoint(self):
+        # Checkpoints inside the burst, at its edges and around it
+        for stop in (5, 19, 20, 21, 150, 319, 320, 339):
+            with self.subTest(stop=stop):
+                self.assertEqual(
+                    self.scan(self.query, self.checkpoint(self.expected[stop])),
+                    self.expected[stop + 1 :],
+                )
+
+
+class RangePlanTests(BurstMixin, TestCase):
+    def plans(self):
+        yield "exact", self.command._plan_ranges(self.query, 8, "second")
+        # About 21 of the 340 ids end in 0, enough for the sampled planner
+        yield "sampled", self.command._plan_sampled_ranges(self.query, 4, 1)
+
+    def range_ids(self, ranges):
+        return [
+            self.scan(
+                self.command._get_query_by_range(range_start=start, range_end=end)
+            )
+            for _, start, end in ranges
+        ]
+
+    def test_ranges_partition_the_rows(self):
+        for planner, (total, ranges) in self.plans():
+            with self.subTest(planner=planner):
+                ids = sum(self.range_ids(ranges), [])
+                self.assertEqual(ids, self.expected)
+
+    def test_hot_bucket_is_split(self):
+        total, ranges = self.command._plan_ranges(self.query, 8, "second")
+
+        self.assertEqual(total, 340)
+        sizes = [len(ids) for ids in self.range_ids(ranges)]
+        # The burst alone is 300 rows; every range stays within its share
+        self.assertLessEqual(max(sizes), -(-340 // 8))
+
+    def test_resume_inside_range(self):
+        _, ranges = self.command._plan_ranges(self.query, 8, "second")
+        for (_, start, end), ids in zip(ranges, self.range_ids(ranges)):
+            query = self.command._get_query_by_range(range_start=start, range_end=end)
+            with self.subTest(start=start):
+                stop = len(ids) // 2
+                self.assertEqual(
+                    self.scan(query, self.checkpoint(ids[stop])), ids[stop + 1 :]
+                )
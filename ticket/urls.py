@@ -0,0 +1,10 @@
+from django.urls import path
+
+from ticket import views
+
+app_name = "ticket"
+
+urlpatterns = [
+    path("tokens/validate/", views.token_validate, name="token-validate"),
+    path("tokens/<str:token>/", views.token_lookup, name="token-lookup"),
+]
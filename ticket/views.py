@@ -1 +1,41 @@
-# Create your views here.
+import json
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from ticket.lookup import lookup_token, lookup_tokens
+
+
+@require_GET
+def token_lookup(request, token):
+    """Resolve a ticket token to the ticket, its order and its user"""
+    payload = lookup_token(token)
+    if payload is None:
+        return JsonResponse({"detail": "Token not found"}, status=404)
+    return JsonResponse(payload)
+
+
+# Scanners are machine clients without a session, so there is no CSRF token
+@csrf_exempt
+@require_POST
+def token_validate(request):
+    """Validate a batch of tokens: {"tokens": [...]} -> {"results": {token: payload}}"""
+    try:
+        tokens = json.loads(request.body)["tokens"]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"detail": 'Expected {"tokens": [...]}'}, status=400)
+    if not isinstance(tokens, list) or not all(
+        isinstance(token, str) for token in tokens
+    ):
+        return JsonResponse({"detail": "tokens must be a list of strings"}, status=400)
+    if len(tokens) > settings.TOKEN_VALIDATE_MAX_BATCH:
+        return JsonResponse(
+            {
+                "detail": f"At most {settings.TOKEN_VALIDATE_MAX_BATCH} tokens "
+                "per request"
+            },
+            status=400,
+        )
+    return JsonResponse({"results": lookup_tokens(tokens)})
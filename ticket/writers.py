@@ -0,0 +1,127 @@
+from django.db import connection
+
+from ticket.models import Ticket
+
+
+class TokenWriter:
+    """Write a batch of regenerated tokens back to the ticket table
+
+    Every ticket handed to a writer carries id, order_id, token and
+    updated_at; writers must only change token and updated_at.
+    """
+
+    name = None
+
+    def write(self, tickets):
+        raise NotImplementedError
+
+
+class BulkUpdateWriter(TokenWriter):
+    """Django bulk_update, i.e. one UPDATE with a CASE WHEN id=... per column"""
+
+    name = "bulk_update"
+
+    def write(self, tickets):
+        Ticket.objects.bulk_update(tickets, fields=["token", "updated_at"])
+
+
+class ValuesUpdateWriter(TokenWriter):
+    """One UPDATE joined against the batch inlined as a VALUES list
+
+    Only rows that still exist are touched: a ticket hard-deleted after
+    its page was read drops out of the join instead of being inserted
+    back, as an INSERT ... ON DUPLICATE KEY UPDATE would.
+    """
+
+    name = "values"
+
+    def write(self, tickets):
+        pk = Ticket._meta.pk
+        updated_at = Ticket._meta.get_field("updated_at")
+        ticket = connection.ops.quote_name(Ticket._meta.db_table)
+
+        params = []
+        for t in tickets:
+            params += [
+                pk.get_db_prep_value(t.id, connection),
+                t.token,
+                updated_at.get_db_prep_value(t.updated_at, connection),
+            ]
+
+        if connection.vendor == "mysql":
+            rows = ", ".join(["ROW(%s, %s, %s)"] * len(tickets))
+            sql = (
+                f"UPDATE {ticket} t JOIN (VALUES {rows}) AS v (id, token, updated_at) "
+                f"ON t.id = v.id SET t.token = v.token, t.updated_at = v.updated_at"
+            )
+        else:
+            rows = ", ".join(["(%s, %s, %s)"] * len(tickets))
+            sql = (
+                f"WITH v (id, token, updated_at) AS (VALUES {rows}) "
+                f"UPDATE {ticket} SET token = v.token, updated_at = v.updated_at "
+                f"FROM v WHERE {ticket}.id = v.id"
+            )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+class StagingTableWriter(TokenWriter):
+    """Load the batch into a temporary staging table, then apply one joined UPDATE
+
+    Temporary tables are private to the connection, so concurrent workers
+    each get their own staging table without any naming scheme.
+    """
+
+    name = "staging"
+    table = "ticket_token_staging"
+
+    def write(self, tickets):
+        pk = Ticket._meta.pk
+        token = Ticket._meta.get_field("token")
+        updated_at = Ticket._meta.get_field("updated_at")
+        qn = connection.ops.quote_name
+        staging, ticket = qn(self.table), qn(Ticket._meta.db_table)
+
+        rows = [
+            (
+                pk.get_db_prep_value(t.id, connection),
+                t.token,
+                updated_at.get_db_prep_value(t.updated_at, connection),
+            )
+            for t in tickets
+        ]
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} ("
+                f"id {pk.db_type(connection)} NOT NULL PRIMARY KEY, "
+                f"token {token.db_type(connection)} NOT NULL, "
+                f"updated_at {updated_at.db_type(connection)} NOT NULL)"
+            )
+            cursor.execute(f"DELETE FROM {staging}")
+            # pymysql folds executemany of a plain INSERT into one multi-row statement
+            cursor.executemany(
+                f"INSERT INTO {staging} (id, token, updated_at) VALUES (%s, %s, %s)",
+                rows,
+            )
+            if connection.vendor == "mysql":
+                cursor.execute(
+                    f"UPDATE {ticket} t JOIN {staging} s ON t.id = s.id "
+                    f"SET t.token = s.token, t.updated_at = s.updated_at"
+                )
+            else:
+                cursor.execute(
+                    f"UPDATE {ticket} SET token = s.token, updated_at = s.updated_at "
+                    f"FROM {staging} s WHERE {ticket}.id = s.id"
+                )
+
+
+WRITERS = {
+    writer.name: writer
+    for writer in (BulkUpdateWriter, ValuesUpdateWriter, StagingTableWriter)
+}
+
+
+def get_writer(name):
+    """Instantiate the token writer registered under name"""
+    return WRITERS[name]()
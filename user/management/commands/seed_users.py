@@ -1,7 +1,9 @@
 import random
-import uuid
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 from user.models import User
+from utils.basemodel import bulk_insert, new_uuid
+from utils.workload import PROFILES
 from faker import Faker
 
 
@@ -10,28 +12,51 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("--count", type=int, default=1000)
+        parser.add_argument(
+            "--seed", type=int, help="Seed random and Faker for a reproducible dataset"
+        )
+        parser.add_argument(
+            "--profile",
+            choices=list(PROFILES),
+            default="uniform",
+            help="Workload profile shaping domains, timestamps and deletions",
+        )
 
     def handle(self, *args, **options):
         count = options["count"]
+        if options["seed"] is not None:
+            random.seed(options["seed"])
+            Faker.seed(options["seed"])
         self.stdout.write(f"Creating {count} users...")
 
-        # Define allowed email domains
-        domains = ["gmail.com", "example.com", "outlook.com"]
+        profile = PROFILES[options["profile"]]
         fake = Faker()
+        now = timezone.now()
 
         # Prepare list of user objects for bulk creation
+        # bulk_create skips save(), so email_domain is set explicitly
         users = [
             User(
-                email=f"{str(uuid.uuid4())[:10]}@{random.choice(domains)}",
+                # Keys and emails come from the seeded random too
+                id=new_uuid(random),
+                email=f"{random.getrandbits(40):010x}@{domain}",
+                email_domain=domain,
                 first_name=fake.first_name(),
                 last_name=fake.last_name(),
                 password=fake.password(),
+                created_at=created_at,
+                updated_at=created_at,
+                deleted_at=now if deleted else None,
+            )
+            for domain, created_at, deleted in zip(
+                profile.sample_domains(random, count),
+                profile.sample_created_at(random, now, count),
+                profile.sample_deleted(random, count),
             )
-            for _ in range(count)
         ]
 
         # Bulk create all users in a single query
-        created_users = User.objects.bulk_create(users)
+        created_users = bulk_insert(User, users)
 
         # Log created users
         for user in created_users:
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.3 on 2026-10-17 07:04
+
+from django.db import migrations, models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Lower, Reverse, Right, StrIndex
+
+
+def email_domain():
+    """The text after the last "@", lowered, as User.get_email_domain() takes it"""
+    return Lower(
+        Case(
+            When(
+                email__contains="@",
+                then=Right("email", StrIndex(Reverse("email"), Value("@")) - 1),
+            ),
+            default=F("email"),
+            output_field=models.CharField(),
+        )
+    )
+
+
+def backfill_email_domain(apps, schema_editor):
+    User = apps.get_model("user", "User")
+    # One set-based UPDATE, run before the index exists so it is not maintained row by row
+    User._base_manager.update(email_domain=email_domain())
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="email_domain",
+            field=models.CharField(default="", editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_email_domain, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["email_domain"], name="user_email_d_40d69e_idx"),
+        ),
+    ]
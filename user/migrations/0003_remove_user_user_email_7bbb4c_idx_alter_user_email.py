@@ -0,0 +1,21 @@
+# Generated by Django 5.1.3 on 2026-10-17 07:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0002_user_email_domain"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="user",
+            name="user_email_7bbb4c_idx",
+        ),
+        migrations.AlterField(
+            model_name="user",
+            name="email",
+            field=models.EmailField(max_length=254, unique=True),
+        ),
+    ]
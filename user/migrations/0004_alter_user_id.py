@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-17 07:24
+
+import utils.basemodel
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0003_remove_user_user_email_7bbb4c_idx_alter_user_email"),
+    ]
+
+    # State only: ticket.0005 rewrites the key columns of all three tables
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="user",
+                    name="id",
+                    field=utils.basemodel.BinaryUUIDField(
+                        default=utils.basemodel.new_uuid,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+            ],
+        ),
+    ]
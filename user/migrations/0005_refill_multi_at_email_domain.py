@@ -0,0 +1,24 @@
+# Generated by Django 5.1.15 on 2026-10-17 09:02
+
+from django.db import migrations
+from django.db.models import Value
+from django.db.models.functions import Lower, Reverse, Right, StrIndex
+
+
+def refill_email_domain(apps, schema_editor):
+    User = apps.get_model("user", "User")
+    # 0002 first took the text after the first "@"; only emails with more
+    # than one can differ from what save() writes
+    User._base_manager.filter(email__regex="@.*@").update(
+        email_domain=Lower(Right("email", StrIndex(Reverse("email"), Value("@")) - 1))
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("user", "0004_alter_user_id"),
+    ]
+
+    operations = [
+        migrations.RunPython(refill_email_domain, migrations.RunPython.noop),
+    ]
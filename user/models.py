@@ -6,15 +6,26 @@ from utils.basemodel import BaseModel
 class User(AbstractBaseUser, BaseModel):
     first_name = models.CharField(max_length=150, null=False, blank=False)
     last_name = models.CharField(max_length=150, null=False, blank=False)
-    email = models.EmailField(unique=True, db_index=True, null=False, blank=False)
+    email = models.EmailField(unique=True, null=False, blank=False)
+    # Denormalised from email so domain filters are an index seek, not LIKE '%@...'
+    email_domain = models.CharField(max_length=255, editable=False, default="")
 
     class Meta:
         db_table = "user"
+        # email (unique) is already indexed by its field
         indexes = [
-            models.Index(fields=["email"]),
             models.Index(fields=["first_name", "last_name"]),
+            models.Index(fields=["email_domain"]),
         ]
 
+    @staticmethod
+    def get_email_domain(email):
+        return email.rsplit("@", 1)[-1].lower()
+
+    def save(self, *args, **kwargs):
+        self.email_domain = self.get_email_domain(self.email)
+        super().save(*args, **kwargs)
+
     @property
     def name(self):
         return f"{self.first_name} {self.last_name}"
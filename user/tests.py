@@ -1 +1,51 @@
-# Create your tests here.
+import importlib
+
+from django.apps import apps
+from django.test import TestCase
+
+from user.models import User
+
+backfill = importlib.import_module("user.migrations.0002_user_email_domain")
+refill = importlib.import_module("user.migrations.0005_refill_multi_at_email_domain")
+
+
+class EmailDomainTests(TestCase):
+    emails = [
+        "ada@Example.com",
+        '"ada@home"@example.COM',
+        "a@b@c.example.com",
+    ]
+
+    def setUp(self):
+        for email in self.emails:
+            User.objects.create(email=email, first_name="Ada", last_name="Lovelace")
+        self.saved = dict(User.objects.values_list("email", "email_domain"))
+
+    def test_save_takes_text_after_last_at(self):
+        self.assertEqual(
+            self.saved,
+            {
+                "ada@Example.com": "example.com",
+                '"ada@home"@example.COM': "example.com",
+                "a@b@c.example.com": "c.example.com",
+            },
+        )
+
+    def domains(self):
+        return dict(User.objects.values_list("email", "email_domain"))
+
+    def test_backfill_agrees_with_save(self):
+        User.objects.update(email_domain="")
+        backfill.backfill_email_domain(apps, None)
+
+        self.assertEqual(self.domains(), self.saved)
+
+    def test_refill_fixes_first_at_domains(self):
+        # What the backfill used to write: the text after the first "@"
+        for user in User.objects.all():
+            User.objects.filter(pk=user.pk).update(
+                email_domain=user.email.split("@", 1)[1].lower()
+            )
+        refill.refill_email_domain(apps, None)
+
+        self.assertEqual(self.domains(), self.saved)
@@ -1,33 +1,290 @@
-from django.db import models
+from functools import partial
+from django.conf import settings
+from django.db import connections, models, router, transaction
+from django.db.models import lookups
+from django.dispatch import Signal
+import random
+import time
 import uuid
 from django.utils import timezone
-from django.db.models.signals import post_delete
 
+_system_random = random.SystemRandom()
 
-class BaseModelManager(models.Manager):
+# Sent once per soft-deleted batch, after commit, with sender and pks
+post_soft_delete = Signal()
+
+
+def uuid7(timestamp=None, rng=_system_random):
+    """Time-ordered UUID (RFC 9562 version 7): Unix milliseconds, then 74 random bits
+
+    Consecutive keys land next to each other in the clustered index instead
+    of splitting pages all over it. rng lets seeders generate them
+    reproducibly.
+    """
+    ms = int((time.time() if timestamp is None else timestamp) * 1000)
+    rand_a, rand_b = rng.getrandbits(12), rng.getrandbits(62)
+    return uuid.UUID(
+        int=(ms & 0xFFFFFFFFFFFF) << 80 | 0x7 << 76 | rand_a << 64 | 0b10 << 62 | rand_b
+    )
+
+
+def new_uuid(rng=None):
+    """Default primary key: UUIDv7 when UUID7_KEYS is on, else UUIDv4
+
+    Seeders pass their seeded rng, so a seed reproduces the keys too.
+    """
+    if settings.UUID7_KEYS:
+        return uuid7(rng=rng or _system_random)
+    if rng is None:
+        return uuid.uuid4()
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+class BinaryUUIDField(models.UUIDField):
+    """A UUIDField stored as binary(16) on MySQL when BINARY_UUID_KEYS is on
+
+    Django stores UUIDs as char(32) on MySQL, so the key takes twice the
+    bytes in the clustered index and again in every secondary index and
+    foreign key. Other backends keep UUIDField's own storage. Existing
+    tables are converted with convert_uuid_keys before the setting flips.
+    """
+
+    def get_internal_type(self):
+        # Not "UUIDField": MySQL's UUID converter cannot read raw bytes
+        return "BinaryUUIDField"
+
+    def stores_binary(self, connection):
+        return connection.vendor == "mysql" and settings.BINARY_UUID_KEYS
+
+    def db_type(self, connection):
+        if self.stores_binary(connection):
+            return "binary(16)"
+        return models.UUIDField().db_type(connection)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if not self.stores_binary(connection):
+            return super().get_db_prep_value(value, connection, prepared)
+        if value is None:
+            return None
+        if not isinstance(value, uuid.UUID):
+            value = self.to_python(value)
+        return value.bytes
+
+    def from_db_value(self, value, expression, connection):
+        if value is None or isinstance(value, uuid.UUID):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)) and len(value) == 16:
+            return uuid.UUID(bytes=bytes(value))
+        return uuid.UUID(value)
+
+
+class HexPatternMixin:
+    """Match text patterns against the hex form of a binary-stored UUID"""
+
+    def process_lhs(self, compiler, connection, lhs=None):
+        sql, params = super().process_lhs(compiler, connection, lhs)
+        if self.lhs.output_field.stores_binary(connection):
+            sql = f"LOWER(HEX({sql}))"
+        return sql, params
+
+
+@BinaryUUIDField.register_lookup
+class HexContains(HexPatternMixin, lookups.Contains):
+    pass
+
+
+@BinaryUUIDField.register_lookup
+class HexStartsWith(HexPatternMixin, lookups.StartsWith):
+    pass
+
+
+@BinaryUUIDField.register_lookup
+class HexEndsWith(HexPatternMixin, lookups.EndsWith):
+    pass
+
+
+class BaseModelQuerySet(models.QuerySet):
+    def soft_delete(self, batch_size=1000, deleted_at=None):
+        """Soft-delete these rows and cascade to their children, level by level
+
+        Each batch of up to batch_size rows is one UPDATE, and its keys then
+        select the next level's rows through CASCADE foreign keys between
+        BaseModels. Children reached through the cascade also clear the
+        model's ancestors_alive_field, if it declares one. post_soft_delete
+        is sent per batch once the transaction commits. Returns the number
+        of rows soft-deleted across all levels.
+        """
+        deleted_at = deleted_at or timezone.now()
+        # Selected and updated on the write database, not a read replica
+        db = self._db or router.db_for_write(self.model)
+        with transaction.atomic(using=db):
+            return _soft_delete(
+                self.model,
+                self.using(db).filter(deleted_at__isnull=True),
+                deleted_at,
+                batch_size,
+            )
+
+
+def _soft_delete(model, queryset, deleted_at, batch_size, cascaded=False):
+    fields = {"deleted_at": deleted_at, "updated_at": deleted_at}
+    if cascaded and model.ancestors_alive_field:
+        fields[model.ancestors_alive_field] = False
+    children = [
+        relation
+        for relation in model._meta.related_objects
+        if relation.on_delete is models.CASCADE
+        and issubclass(relation.related_model, BaseModel)
+    ]
+
+    count = 0
+    pks = list(queryset.values_list("pk", flat=True))
+    for start in range(0, len(pks), batch_size):
+        batch = pks[start : start + batch_size]
+        count += (
+            model.all_objects.using(queryset.db).filter(pk__in=batch).update(**fields)
+        )
+        transaction.on_commit(
+            partial(post_soft_delete.send, sender=model, pks=batch),
+            using=queryset.db,
+        )
+        for relation in children:
+            child = relation.related_model
+            count += _soft_delete(
+                child,
+                child.all_objects.using(queryset.db).filter(
+                    **{f"{relation.field.name}__in": batch}, deleted_at__isnull=True
+                ),
+                deleted_at,
+                batch_size,
+                cascaded=True,
+            )
+    return count
+
+
+class BaseModelManager(models.Manager.from_queryset(BaseModelQuerySet)):
     def get_queryset(self):
         return super().get_queryset().filter(deleted_at__isnull=True)
 
 
 class BaseModel(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = BinaryUUIDField(primary_key=True, default=new_uuid, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     deleted_at = models.DateTimeField(null=True, blank=True)
 
     objects = BaseModelManager()  # Default manager, returns only non-deleted records
-    all_objects = (
-        models.Manager()
-    )  # Manager to query all records, including deleted ones
+    all_objects = models.Manager.from_queryset(
+        BaseModelQuerySet
+    )()  # Manager to query all records, including deleted ones
+
+    # Boolean field that soft_delete() clears when a parent row is soft-deleted
+    ancestors_alive_field = None
 
     class Meta:
         abstract = True
 
     def delete(self, using=None, keep_parents=False, logical_del=True) -> None:
         if logical_del:
-            self.deleted_at = timezone.now()
-            self.save()
-            # send signal
-            post_delete.send(sender=self.__class__, instance=self)
+            self.deleted_at = self.updated_at = timezone.now()
+            using = using or router.db_for_write(self.__class__, instance=self)
+            type(self).all_objects.using(using).filter(pk=self.pk).soft_delete(
+                deleted_at=self.deleted_at
+            )
         else:
             super().delete(using, keep_parents)
+
+
+def bulk_insert(model, objs, batch_size=None):
+    """bulk_create() that keeps the created_at/updated_at set on each instance
+
+    bulk_create() runs pre_save(), where auto_now and auto_now_add overwrite
+    them with the current time. A raw insert, as loaddata does, writes every
+    field as it stands on the instance instead.
+    """
+    using = router.db_for_write(model)
+    fields = model._meta.concrete_fields
+    max_size = connections[using].ops.bulk_batch_size(fields, objs)
+    batch_size = min(batch_size, max_size) if batch_size else max_size
+    queryset = model._base_manager.using(using)
+    with transaction.atomic(using=using, savepoint=False):
+        for start in range(0, len(objs), batch_size):
+            queryset._insert(
+                objs[start : start + batch_size], fields=fields, raw=True, using=using
+            )
+    for obj in objs:
+        obj._state.adding = False
+        obj._state.db = using
+    return objs
+
+
+def uuid_key_columns(models):
+    """{model: fields} of the BinaryUUIDField keys and the foreign keys to them"""
+    columns = {}
+    for model in models:
+        fields = [
+            field
+            for field in model._meta.local_fields
+            if isinstance(field, BinaryUUIDField)
+            or (field.many_to_one and isinstance(field.target_field, BinaryUUIDField))
+        ]
+        if fields:
+            columns[model] = fields
+    return columns
+
+
+def convert_uuid_keys(schema_editor, models, to_binary):
+    """Rewrite the models' UUID key columns in place between char(32) and binary(16)
+
+    MySQL only; other backends store these columns the same either way.
+    Foreign keys between the columns are dropped for the rewrite and added
+    back afterwards. Each column goes through varbinary(32), so no byte is
+    truncated while its value is converted between hex and raw bytes.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != "mysql":
+        return
+    qn = schema_editor.quote_name
+    columns = uuid_key_columns(models)
+    tables = {model._meta.db_table for model in columns}
+
+    foreign_keys = []
+    with connection.cursor() as cursor:
+        for table in tables:
+            constraints = connection.introspection.get_constraints(cursor, table)
+            foreign_keys.extend(
+                (table, name, info["columns"][0], info["foreign_key"])
+                for name, info in constraints.items()
+                if info["foreign_key"] and info["foreign_key"][0] in tables
+            )
+    for table, name, _, _ in foreign_keys:
+        schema_editor.execute(f"ALTER TABLE {qn(table)} DROP FOREIGN KEY {qn(name)}")
+
+    final_type, convert = (
+        ("binary(16)", "UNHEX({})") if to_binary else ("char(32)", "LOWER(HEX({}))")
+    )
+    for model, fields in columns.items():
+        table = qn(model._meta.db_table)
+
+        def modify(column_type):
+            return ", ".join(
+                f"MODIFY {qn(field.column)} {column_type}"
+                f"{'' if field.null else ' NOT NULL'}"
+                for field in fields
+            )
+
+        schema_editor.execute(f"ALTER TABLE {table} {modify('varbinary(32)')}")
+        schema_editor.execute(
+            f"UPDATE {table} SET "
+            + ", ".join(
+                f"{qn(field.column)} = {convert.format(qn(field.column))}"
+                for field in fields
+            )
+        )
+        schema_editor.execute(f"ALTER TABLE {table} {modify(final_type)}")
+
+    for table, name, column, (to_table, to_column) in foreign_keys:
+        schema_editor.execute(
+            f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} "
+            f"FOREIGN KEY ({qn(column)}) REFERENCES {qn(to_table)} ({qn(to_column)})"
+        )
@@ -0,0 +1,103 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Wall-clock time until which this context's reads stay on the primary
+_pinned_until = ContextVar("pinned_until", default=0.0)
+_primary_only = ContextVar("primary_only", default=False)
+
+STICKY_COOKIE = "primary_until"
+
+
+@contextmanager
+def use_primary():
+    """Read from the primary inside the block, e.g. where replica lag matters"""
+    token = _primary_only.set(True)
+    try:
+        yield
+    finally:
+        _primary_only.reset(token)
+
+
+def pin_to_primary(seconds=None):
+    """Keep this context's reads on the primary for the next seconds"""
+    if seconds is None:
+        seconds = settings.REPLICA_STICKY_SECONDS
+    _pinned_until.set(max(_pinned_until.get(), time.time() + seconds))
+
+
+def reads_pinned():
+    return (
+        _primary_only.get()
+        or time.time() < _pinned_until.get()
+        # A read inside a write transaction must see that transaction
+        or connections[DEFAULT_DB_ALIAS].in_atomic_block
+    )
+
+
+class PrimaryReplicaRouter:
+    """Send reads to a DATABASE_REPLICAS alias and everything else to the primary
+
+    Replicas lag the primary, so a context that writes keeps reading from
+    the primary for REPLICA_STICKY_SECONDS (read-your-writes); in a request
+    ReplicaStickinessMiddleware carries that over to the client's next
+    requests. Without replicas every query goes to default.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or reads_pinned():
+            return DEFAULT_DB_ALIAS
+        # Related objects are read from wherever their instance came from
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        if settings.DATABASE_REPLICAS and settings.REPLICA_STICKY_SECONDS:
+            pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaStickinessMiddleware:
+    """Keep a client's reads on the primary for a while after it wrote
+
+    The deadline travels in a cookie, so the client's next requests read
+    their own writes whichever process serves them.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(STICKY_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0.0
+        token = _pinned_until.set(pinned_until)
+        try:
+            response = self.get_response(request)
+            if _pinned_until.get() > pinned_until:
+                response.set_cookie(
+                    STICKY_COOKIE,
+                    f"{_pinned_until.get():.3f}",
+                    max_age=settings.REPLICA_STICKY_SECONDS,
+                    httponly=True,
+                    samesite="Lax",
+                )
+        finally:
+            _pinned_until.reset(token)
+        return response
@@ -0,0 +1,258 @@
+import functools
+import os
+import statistics
+import threading
+import time
+from collections import Counter, deque
+
+from django.db.backends.mysql.base import DatabaseWrapper as MySQLDatabaseWrapper
+
+# {(alias, pid): (settings, ConnectionPool)}; a forked child must not share its
+# parent's sockets, and a pool is rebuilt when the alias's settings change
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """A bounded, thread-safe pool of DB-API connections to one database
+
+    Keeps up to size idle connections and opens up to max_overflow more
+    under load; a checkout beyond that waits up to timeout seconds, then
+    raises error. Connections older than max_lifetime are replaced rather
+    than reused, and one idle for health_check_idle seconds or more is
+    pinged before it is handed out.
+    """
+
+    def __init__(
+        self,
+        connect,
+        error,
+        size=20,
+        max_overflow=10,
+        timeout=30.0,
+        max_lifetime=1800.0,
+        health_check_idle=5.0,
+    ):
+        self.connect = connect
+        self.error = error
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_idle = health_check_idle
+        self.condition = threading.Condition()
+        # (connection, returned at), most recently returned last
+        self.idle = []
+        self.opened_at = {}
+        self.open = 0
+        self.counters = Counter()
+        # Seconds each recent checkout took, waiting and connecting included
+        self.waits = deque(maxlen=10000)
+        self.closed = False
+
+    @property
+    def capacity(self):
+        return self.size + self.max_overflow
+
+    def checkout(self):
+        start = time.monotonic()
+        while True:
+            entry = self._reserve(start)
+            if entry is None:
+                connection = self._open()
+                break
+            connection, returned_at = entry
+            if self._expired(connection):
+                self.counters["recycled"] += 1
+                self._discard(connection)
+                continue
+            if time.monotonic() - returned_at >= self.health_check_idle:
+                if not self.healthy(connection):
+                    self.counters["health_check_failures"] += 1
+                    self._discard(connection)
+                    continue
+            break
+        with self.condition:
+            self.counters["checkouts"] += 1
+            self.waits.append(time.monotonic() - start)
+        return connection
+
+    def checkin(self, connection, reusable=True):
+        """Return a checked-out connection, rolled back, or close it if it is spent"""
+        if reusable and not self._expired(connection) and self._reset(connection):
+            with self.condition:
+                if not self.closed and len(self.idle) < self.size:
+                    self.idle.append((connection, time.monotonic()))
+                    self.condition.notify()
+                    return
+        self._discard(connection)
+
+    def close(self):
+        """Close the idle connections; ones checked out are closed on checkin"""
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def healthy(self, connection):
+        try:
+            connection.ping(False)
+        except Exception:
+            return False
+        return True
+
+    def stats(self):
+        """Counters and checkout wait percentiles of this process's pool"""
+        with self.condition:
+            waits = sorted(seconds * 1000 for seconds in self.waits)
+            stats = {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "open": self.open,
+                "idle": len(self.idle),
+                "in_use": self.open - len(self.idle),
+                "checkouts": self.counters["checkouts"],
+                "opened": self.counters["opened"],
+                "recycled": self.counters["recycled"],
+                "health_check_failures": self.counters["health_check_failures"],
+                "timeouts": self.counters["timeouts"],
+            }
+        quantiles = (
+            statistics.quantiles(waits, n=100, method="inclusive")
+            if len(waits) > 1
+            else waits * 99
+        )
+        stats["p50_wait_ms"] = quantiles[49] if quantiles else None
+        stats["p99_wait_ms"] = quantiles[98] if quantiles else None
+        stats["max_wait_ms"] = waits[-1] if waits else None
+        return stats
+
+    def _reserve(self, start):
+        """Take an idle connection, or None and a slot to open one; wait for either"""
+        deadline = start + self.timeout
+        with self.condition:
+            while True:
+                if self.idle:
+                    return self.idle.pop()
+                if self.open < self.capacity:
+                    self.open += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    raise self.error(
+                        f"No connection free in the pool after {self.timeout}s; "
+                        f"all {self.capacity} are checked out"
+                    )
+                self.condition.wait(remaining)
+
+    def _open(self):
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self.condition:
+                self.open -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.opened_at[connection] = time.monotonic()
+            self.counters["opened"] += 1
+        return connection
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self.condition:
+            self.opened_at.pop(connection, None)
+            self.open -= 1
+            self.condition.notify()
+
+    def _expired(self, connection):
+        return time.monotonic() - self.opened_at[connection] >= self.max_lifetime
+
+    def _reset(self, connection):
+        """Roll back whatever the last borrower left open; False if that fails"""
+        try:
+            if not connection.open:
+                return False
+            if not connection.get_autocommit():
+                connection.rollback()
+        except Exception:
+            return False
+        return True
+
+
+def get_pool(alias, conn_params, options, connect, error):
+    """This process's pool for alias, built from POOL_OPTIONS on first use
+
+    connect(conn_params) opens a connection. A pool built from other
+    conn_params or options is closed and replaced, so changed settings
+    take effect instead of the first ones being kept for good.
+    """
+    key = (alias, os.getpid())
+    settings = (conn_params, options)
+    with _pools_lock:
+        current = _pools.get(key)
+        if current is not None and current[0] == settings:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        pool = ConnectionPool(
+            functools.partial(connect, conn_params),
+            error,
+            size=options.get("POOL_SIZE", 20),
+            max_overflow=options.get("MAX_OVERFLOW", 10),
+            timeout=options.get("TIMEOUT", 30.0),
+            max_lifetime=options.get("MAX_LIFETIME", 1800.0),
+            health_check_idle=options.get("HEALTH_CHECK_IDLE", 5.0),
+        )
+        _pools[key] = (settings, pool)
+        return pool
+
+
+def pool_stats():
+    """{alias: stats} of every pool this process has opened"""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = {
+            alias: pool for (alias, owner), (_, pool) in _pools.items() if owner == pid
+        }
+    return {alias: pool.stats() for alias, pool in pools.items()}
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+    """The MySQL backend, borrowing its connections from a ConnectionPool
+
+    close() hands the connection back instead of closing it, so with
+    CONN_MAX_AGE = 0 each request, and each worker thread that closes its
+    connections, holds one only while it runs. POOL_OPTIONS, all optional:
+    POOL_SIZE idle connections kept, MAX_OVERFLOW more opened under load,
+    TIMEOUT seconds a checkout waits, MAX_LIFETIME seconds a connection is
+    reused for and HEALTH_CHECK_IDLE seconds idle before it is pinged.
+    """
+
+    pool = None
+
+    @property
+    def pool_capacity(self):
+        options = self.settings_dict.get("POOL_OPTIONS", {})
+        return options.get("POOL_SIZE", 20) + options.get("MAX_OVERFLOW", 10)
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(
+            self.alias,
+            conn_params,
+            self.settings_dict.get("POOL_OPTIONS", {}),
+            super().get_new_connection,
+            self.Database.OperationalError,
+        )
+        return self.pool.checkout()
+
+    def _close(self):
+        if self.connection is not None:
+            # A connection that raised is only reused if it still answers
+            reusable = not self.errors_occurred or self.pool.healthy(self.connection)
+            self.pool.checkin(self.connection, reusable)
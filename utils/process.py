@@ -0,0 +1,9 @@
+import os
+
+import django
+
+
+def setup_django(settings_module):
+    """Initialise Django inside a freshly spawned worker process"""
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    django.setup()
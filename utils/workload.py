@@ -0,0 +1,95 @@
+import itertools
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+
+@dataclass(frozen=True)
+class Burst:
+    """A sale event: a share of all rows created within a few hours"""
+
+    at: float  # Position in the profile's span, 0 is the oldest and 1 is now
+    hours: float
+    weight: float  # Share of all rows created during the burst
+
+
+@dataclass(frozen=True)
+class WorkloadProfile:
+    """Declarative shape of a seeded dataset, shared by every seed command"""
+
+    domains: dict = field(
+        default_factory=lambda: {"gmail.com": 1, "example.com": 1, "outlook.com": 1}
+    )
+    deleted_ratio: float = 0.0  # Share of users and orders that are soft-deleted
+    whale_ratio: float = 0.0  # Share of users who place whale_weight times the orders
+    whale_weight: float = 1.0
+    fanout_alpha: float = 0.0  # Pareto shape of tickets per order; 0 is uniform
+    span_days: float = 0.0  # How far back created_at reaches; 0 is "now"
+    bursts: tuple = ()
+
+    def sample_domains(self, rng, k):
+        return rng.choices(list(self.domains), weights=list(self.domains.values()), k=k)
+
+    def sample_deleted(self, rng, k):
+        return [rng.random() < self.deleted_ratio for _ in range(k)]
+
+    def sample_created_at(self, rng, now, k):
+        """created_at values: uniform over the span, except for the bursts' share"""
+        if not self.span_days:
+            return [now] * k
+        span = timedelta(days=self.span_days)
+        values = []
+        for _ in range(k):
+            r = rng.random()
+            for burst in self.bursts:
+                if r < burst.weight:
+                    start = now - span * (1 - burst.at)
+                    offset = timedelta(hours=burst.hours) * rng.random()
+                    values.append(min(now, start + offset))
+                    break
+                r -= burst.weight
+            else:
+                values.append(now - span * rng.random())
+        return values
+
+    def user_cum_weights(self, rng, k):
+        """Cumulative weights for picking the users that orders belong to"""
+        if not self.whale_ratio:
+            return None
+        weights = (
+            self.whale_weight if rng.random() < self.whale_ratio else 1.0
+            for _ in range(k)
+        )
+        return list(itertools.accumulate(weights))
+
+    def order_cum_weights(self, rng, k):
+        """Cumulative weights for picking the orders that tickets belong to"""
+        if not self.fanout_alpha:
+            return None
+        weights = (rng.paretovariate(self.fanout_alpha) for _ in range(k))
+        return list(itertools.accumulate(weights))
+
+
+PROFILES = {
+    # What the seeders always produced: an even domain mix, created "now"
+    "uniform": WorkloadProfile(),
+    # Sale-event bursts, power-law tickets per order, whales and soft deletes
+    "production": WorkloadProfile(
+        domains={
+            "gmail.com": 45,
+            "outlook.com": 25,
+            "example.com": 20,
+            "yahoo.com": 7,
+            "icloud.com": 3,
+        },
+        deleted_ratio=0.07,
+        whale_ratio=0.01,
+        whale_weight=200,
+        fanout_alpha=1.2,
+        span_days=365,
+        bursts=(
+            Burst(at=0.3, hours=2, weight=0.15),
+            Burst(at=0.75, hours=1, weight=0.2),
+            Burst(at=0.97, hours=3, weight=0.15),
+        ),
+    ),
+}